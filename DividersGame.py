@@ -1,4 +1,5 @@
-from copy import deepcopy
+import functools
+import random
 
 import carlo_monte
 import game
@@ -42,22 +43,135 @@ class DividersAiPlayer(minimax.MinimaxPlayer):
         return self.m_char
 
 
+class DividersSolverPlayer(game.Player):
+    """ Plays the moves of the exact solver """
+
+    def __init__(self, char):
+        self.m_char = char
+        self.last_solution = None
+
+    def get_char(self):
+        return self.m_char
+
+    def get_move(self, state):
+        self.last_solution = state.get_solution()
+        return random.choice(state.get_best_moves())
+
+    def get_search_stats(self):
+        if self.last_solution is None:
+            return None
+
+        result, plies = self.last_solution
+        return {'result': result, 'plies': plies}
+
+
+class NumberMasks:
+    """ Bitmasks of numbers (bit n stands for n) """
+
+    def __init__(self, max_number):
+        self.max_number = max_number
+        self.divisors = [0] + [sum(1 << d for d in range(1, n + 1) if n % d == 0) for n in range(1, max_number + 1)]
+        multiples = [0] + [sum(1 << m for m in range(n, max_number + 1, n)) for n in range(1, max_number + 1)]
+        # The numbers a move on n affects, or that affect n
+        self.related = [divisors | n_multiples for divisors, n_multiples in zip(self.divisors, multiples)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_number_masks(max_number) -> NumberMasks:
+    return NumberMasks(max_number)
+
+
+def iter_numbers(mask):
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def canonical_mask(mask, masks: NumberMasks):
+    """
+    Remove the isolated numbers (no remaining divisors or multiples) in pairs: each of them is a move that affects
+    nothing else, so two of them cancel out and the result of the game is the same.
+    Returns the reduced mask and the number of numbers that were removed.
+    """
+    related = masks.related
+    isolated_pairs = 0
+    unpaired = 0
+    remaining = mask
+    while remaining:
+        low_bit = remaining & -remaining
+        remaining ^= low_bit
+        if related[low_bit.bit_length() - 1] & mask == low_bit:
+            if unpaired:
+                isolated_pairs |= unpaired | low_bit
+                unpaired = 0
+            else:
+                unpaired = low_bit
+
+    return mask & ~isolated_pairs, isolated_pairs.bit_count()
+
+
+# canonical mask -> (result for the player to move, plies until the end, move)
+# A winning move is the first one found, a losing position keeps the move that lasts the longest
+SOLUTIONS = {}
+MAX_SOLUTIONS = 250_000  # SOLUTIONS is cleared when it grows beyond that
+MAX_SOLVED_NUMBER = 40  # Searches only get the solutions of states up to that number, solving 1-40 takes seconds
+
+
+def solve(mask, masks: NumberMasks = None):
+    masks = masks or get_number_masks(mask.bit_length() - 1)
+    full_mask = mask
+    mask, removed = canonical_mask(mask, masks)
+
+    solution = SOLUTIONS.get(mask)
+    if solution is None:
+        # Taking the last number wins, so the player to move on an empty board has lost
+        solution = (game.SOLVED_LOSS, 0, None)
+        for n in reversed(list(iter_numbers(mask))):
+            child_result, child_plies, _move = solve(mask & ~masks.divisors[n], masks)
+            if child_result == game.SOLVED_LOSS:
+                solution = (game.SOLVED_WIN, child_plies + 1, n)
+                break
+
+            if solution[2] is None or child_plies + 1 > solution[1]:
+                solution = (game.SOLVED_LOSS, child_plies + 1, n)
+
+        SOLUTIONS[mask] = solution
+
+    result, plies, move = solution
+    if move is None and full_mask:
+        move = full_mask.bit_length() - 1  # Only isolated pairs are left, which are all the same
+    return result, plies + removed, move
+
+
 class DividersState(game.GameState):
+    """ The remaining numbers are a bitmask, bit n is set if n is remaining """
+
+    EVAL_CHAR = AI_CHAR
+
     def __init__(self, numbers, players, last_move=None, player_index=0):
         super().__init__(players, player_index)
         self.m_last_move = last_move
-        self.numbers = numbers
+        self.mask = 0
+        for n in numbers:
+            self.mask |= 1 << n
 
-    def notify_move(self):
+        self.masks = get_number_masks(max(numbers, default=0))
+
+    @property
+    def numbers(self):
+        return list(iter_numbers(self.mask))
+
+    def describe_move(self):
         s = f'Player {self.m_last_move[0].get_char()} took {self.m_last_move[1][0]}'
 
         if len(self.m_last_move[1]) > 1:
             s += f' (and {", ".join(map(str, self.m_last_move[1][1:]))})'
 
-        print(s + '.')
+        return s + '.'
 
     def get_winner(self):
-        if not self.numbers:
+        if not self.mask:
             return self.m_players[self._next_player_index()]
 
     def eval(self):
@@ -68,42 +182,71 @@ class DividersState(game.GameState):
 
         return minimax.INF if winner.get_char() == AI_CHAR else -minimax.INF
 
+    def _solve(self):
+        if len(SOLUTIONS) > MAX_SOLUTIONS:
+            SOLUTIONS.clear()
+
+        return solve(self.mask, self.masks)
+
+    def get_solution(self):
+        """ None above MAX_SOLVED_NUMBER, the exact solver is exponential so the searches fall back to searching """
+        if self.mask.bit_length() - 1 > MAX_SOLVED_NUMBER:
+            return None
+
+        return self._solve()[:2]
+
+    def get_best_moves(self):
+        """ A move that keeps the perfect play result, solved at any size """
+        return (self._solve()[2],)
+
     def get_moves(self):
-        return iter(self.numbers)
+        return iter_numbers(self.mask)
 
     def move(self, move: int):
-        if move in self.numbers:
-            last_move = (self.get_curr_player(), [])
-            new_numbers = self.numbers[::]
-            for n in self.numbers[::-1]:
-                if move % n == 0:
-                    last_move[1].append(n)
-                    new_numbers.remove(n)
-
-            return DividersState(new_numbers, self.m_players, last_move, self._next_player_index())
+        if isinstance(move, int) and 0 < move <= self.masks.max_number and self.mask >> move & 1:
+            removed = self.mask & self.masks.divisors[move]
+
+            # Skip the constructor, everything is already known
+            new_state = object.__new__(DividersState)
+            new_state.m_players = self.m_players
+            new_state.m_curr_player_index = self._next_player_index()
+            new_state.m_moves = None
+            new_state.m_last_move = (self.get_curr_player(), list(iter_numbers(removed))[::-1])
+            new_state.mask = self.mask & ~removed
+            new_state.masks = self.masks
+            return new_state
+
+    def to_bytes(self):
+        # Header: player index, then a bitmask of the remaining numbers (bit n is set if n is remaining)
+        return bytes([self.m_curr_player_index]) + self.mask.to_bytes((self.mask.bit_length() + 7) // 8, 'little')
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        mask = int.from_bytes(data[1:], 'little')
+        return DividersState(list(iter_numbers(mask)), players, player_index=data[0])
 
     def __str__(self):
         return ', '.join(map(str, self.numbers)) + '\n'
 
     def __eq__(self, other) -> bool:
-        return super().__eq__(other) and self.numbers == other.numbers
+        return super().__eq__(other) and self.mask == other.mask
+
+
+MAX_NUMBER = 15
+
+
+def new_game(players, observers=(), max_number=MAX_NUMBER):
+    return game.Game(DividersState(list(range(1, max_number + 1)), players), observers)
 
 
 def main():
     human_player = DividersAiPlayer(HUMAN_CHAR)
     ai_player = DividersAiPlayer(AI_CHAR)
 
-    dividers_game = game.Game(DividersState(list(range(1, 16)), [human_player, ai_player]))
-
-    for state in dividers_game.play():
-        print(state)
-
-    winner = dividers_game.get_winner()
+    dividers_game = new_game([human_player, ai_player], observers=[game.ConsoleObserver()])
 
-    if winner is not None:
-        print(f'The winner is {winner.get_char()}!')
-    else:
-        print(f'It\'s a tie!')
+    for _state in dividers_game.play():
+        pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,153 @@
+"""
+Batch analysis of positions over a process pool: the best move, its score and the principal variation of each.
+
+The results are yielded in the order of the input positions, as soon as the next one in order is ready. The positions
+are read from their iterable only a few chunks ahead of the results, so they can be streamed from large files.
+The scores are from the point of view of the player to move (around +-1000 for a Monte Carlo win).
+
+Example, analysing every position of recorded games:
+    python analysis.py games.jsonl --ms 200 -j 8 > analysis.jsonl
+"""
+import argparse
+import collections
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import typing
+
+import game
+import game_record
+from engine_service import MCTS, MINIMAX, create_engine_player
+
+PV_LENGTH = 8
+PENDING_CHUNKS_PER_PROCESS = 2
+
+
+class PositionAnalysis:
+    def __init__(self, index, move, score, pv, stats, tag=None):
+        self.index = index
+        self.tag = tag  # The tag of the position, if the states were given as (tag, state) pairs
+        self.move = move  # Encoded, like the moves of the pv, with GameState.encode_move()
+        self.score = score
+        self.pv = pv
+        self.stats = stats
+
+    def to_dict(self):
+        return {'index': self.index, 'move': self.move, 'score': self.score, 'pv': self.pv, 'stats': self.stats}
+
+    def __str__(self):
+        return f'#{self.index}: {self.move} ({self.score:+.1f}) pv: {" ".join(map(str, self.pv))}'
+
+
+def _principal_variation(node, pv_length):
+    """ The move of the node and then the most visited replies of the Monte Carlo tree """
+    pv = []
+    while node is not None and node.parent is not None and len(pv) < pv_length:
+        pv.append(node.parent.state.encode_move(node.move))
+        node = max(node.childs, key=lambda child: child.visits, default=None)
+        if node is not None and node.visits == 0:
+            break
+
+    return pv
+
+
+def _analyse(args):
+    """ Runs in a worker process, the state is passed as its class path, chars and bytes """
+    index, tag, state_class_path, chars, data, options, pv_length = args
+    module_name, class_name = state_class_path.rsplit('.', 1)
+    state_class = getattr(importlib.import_module(module_name), class_name)
+    players = [game.PlaceholderPlayer(char) for char in chars]
+    state = state_class.from_bytes(data, players)
+
+    player = create_engine_player(chars[state.m_curr_player_index], options)
+    players[state.m_curr_player_index] = player  # The decoded states share the list
+    move = player.get_move(state)
+    stats = player.get_search_stats()
+
+    if options.get('engine', MCTS) == MINIMAX:
+        score, pv = player.last_score, [state.encode_move(move)]
+    else:
+        # The most visited move rather than the chosen one, which may be barely visited on small budgets, so the move,
+        # its score, the pv and the stats agree. Solved moves are all visited once, the score decides between them.
+        best = max(player.root.parent.childs, key=lambda child: (child.visits, child.get_score()))
+        move, score, pv = best.move, best.get_score(), _principal_variation(best, pv_length)
+        stats = {**stats, 'visits': best.visits, 'score': score}
+
+    return PositionAnalysis(index, state.encode_move(move), score, pv, stats, tag)
+
+
+def _analyse_chunk(chunk):
+    return [_analyse(args) for args in chunk]
+
+
+def _encode_states(states, tagged, options, pv_length):
+    for index, state in enumerate(states):
+        tag = None
+        if tagged:
+            tag, state = state
+
+        state_class = type(state)
+        yield (index,
+               tag,
+               f'{state_class.__module__}.{state_class.__qualname__}',
+               [player.get_char() for player in state.m_players],
+               state.to_bytes(),
+               options,
+               pv_length)
+
+
+def analyse_states(states: typing.Iterable, processes=None, pv_length=PV_LENGTH, chunksize=1, tagged=False,
+                   **options) -> typing.Iterator[PositionAnalysis]:
+    """
+    The options choose the engine and its budget per position, like the requests of engine_service:
+    engine ('mcts' or 'minimax'), iterations or ms, rollout_depth, symmetry, depth.
+    The states can be of any game that implements to_bytes() and from_bytes().
+    tagged - the states are (tag, state) pairs, and the result of each keeps its tag
+    """
+    processes = processes or os.cpu_count()
+    args = _encode_states(states, tagged, options, pv_length)
+    with multiprocessing.Pool(processes) as pool:
+        # Unlike Pool.imap, which reads all of its input ahead, only a few chunks are pending at a time
+        pending = collections.deque()
+        while True:
+            chunk = list(itertools.islice(args, chunksize))
+            if chunk:
+                pending.append(pool.apply_async(_analyse_chunk, (chunk,)))
+            if pending and (not chunk or len(pending) >= PENDING_CHUNKS_PER_PROCESS * processes):
+                yield from pending.popleft().get()
+            elif not chunk:
+                return
+
+
+def iter_recorded_positions(path) -> typing.Iterator[typing.Tuple[str, int, game.GameState]]:
+    """ (game id, ply, state) of every position of the recorded games that has a move to analyse """
+    for record in game_record.iter_games(path):
+        for ply, state in enumerate(record.replay()):
+            if state.get_winner() is None and not state.no_moves():
+                yield record.game_id, ply, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse every position of recorded games.')
+    parser.add_argument('records', help='A game records file, see game_record.py')
+    parser.add_argument('--engine', choices=[MCTS, MINIMAX], default=MCTS)
+    parser.add_argument('--iterations', type=int, default=None)
+    parser.add_argument('--ms', type=int, default=None)
+    parser.add_argument('--depth', type=int, default=None)
+    parser.add_argument('--pv', type=int, default=PV_LENGTH, help='The maximal length of the principal variations')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    options = {key: value for key, value in (('engine', args.engine), ('iterations', args.iterations),
+                                             ('ms', args.ms), ('depth', args.depth)) if value is not None}
+    positions = (((game_id, ply), state) for game_id, ply, state in iter_recorded_positions(args.records))
+    for result in analyse_states(positions, args.processes, args.pv, tagged=True, **options):
+        game_id, ply = result.tag
+        sys.stdout.write(json.dumps({'game': game_id, 'ply': ply, **result.to_dict()}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
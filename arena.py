@@ -0,0 +1,175 @@
+"""
+Play many games between two players over a process pool.
+
+Example:
+    python arena.py four_in_a_row "four_in_a_row.FourInRowAiPlayer('X')" \
+        "four_in_a_row.FourInRowMinimaxPlayer('O', depth=4)" -n 100 -j 8
+"""
+import argparse
+import ast
+import importlib
+import math
+import multiprocessing
+import random
+import time
+
+WIN = 'win'
+DRAW = 'draw'
+LOSS = 'loss'
+
+Z_95 = 1.96
+
+
+class PlayerSpec:
+    """ A picklable recipe of a player: the dotted path of its class and the arguments to create it with """
+
+    def __init__(self, path, *args, **kwargs):
+        self.path = path
+        self.args = args
+        self.kwargs = kwargs
+
+    @staticmethod
+    def parse(text):
+        """ Parse a spec written as a call, e.g. "four_in_a_row.FourInRowAiPlayer('X')" """
+        call = ast.parse(text, mode='eval').body
+        if not isinstance(call, ast.Call):
+            return PlayerSpec(text)
+
+        return PlayerSpec(ast.unparse(call.func),
+                          *(ast.literal_eval(arg) for arg in call.args),
+                          **{keyword.arg: ast.literal_eval(keyword.value) for keyword in call.keywords})
+
+    def create(self):
+        module_name, class_name = self.path.rsplit('.', 1)
+        return getattr(importlib.import_module(module_name), class_name)(*self.args, **self.kwargs)
+
+    def __str__(self):
+        args = [repr(arg) for arg in self.args] + [f'{key}={value!r}' for key, value in self.kwargs.items()]
+        return f'{self.path}({", ".join(args)})'
+
+
+class GameResult:
+    def __init__(self, index, result, plies, secs, a_first):
+        self.index = index
+        self.result = result  # From the point of view of player A
+        self.plies = plies
+        self.secs = secs
+        self.a_first = a_first
+
+    def __str__(self):
+        return f'Game #{self.index + 1}: A {self.result} ({"A" if self.a_first else "B"} first, ' \
+               f'{self.plies} plies, {self.secs:.1f}s)'
+
+
+class ArenaStats:
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.start_time = time.time()
+
+    def add(self, result: GameResult):
+        if result.result == WIN:
+            self.wins += 1
+        elif result.result == DRAW:
+            self.draws += 1
+        else:
+            self.losses += 1
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def score(self):
+        """ The average score of player A (a win is 1, a draw is 0.5) """
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.5
+
+    def confidence_interval(self, z=Z_95):
+        """ Wilson score interval of the score (stays meaningful when all the games end the same way) """
+        if not self.games:
+            return 0.0, 1.0
+
+        score, games = self.score(), self.games
+        center = (score + z ** 2 / (2 * games)) / (1 + z ** 2 / games)
+        margin = z * math.sqrt(score * (1 - score) / games + z ** 2 / (4 * games ** 2)) / (1 + z ** 2 / games)
+        return max(0.0, center - margin), min(1.0, center + margin)
+
+    @staticmethod
+    def score_to_elo(score):
+        score = min(max(score, 1e-3), 1 - 1e-3)
+        return -400 * math.log10(1 / score - 1)
+
+    def games_per_hour(self):
+        elapsed = time.time() - self.start_time
+        return self.games * 3600 / elapsed if elapsed else 0
+
+    def __str__(self):
+        low, high = self.confidence_interval()
+        return f'Games: {self.games}, A: +{self.wins} ={self.draws} -{self.losses} | ' \
+               f'Score: {self.score():.3f} [{low:.3f}, {high:.3f}] | ' \
+               f'Elo: {self.score_to_elo(self.score()):+.0f} ' \
+               f'[{self.score_to_elo(low):+.0f}, {self.score_to_elo(high):+.0f}] | ' \
+               f'{self.games_per_hour():.0f} games/hour'
+
+
+def play_game(game_module_name, spec_a: PlayerSpec, spec_b: PlayerSpec, index, a_first=True, seed=None):
+    if seed is not None:
+        random.seed(seed + index)
+
+    game_module = importlib.import_module(game_module_name)
+    player_a, player_b = spec_a.create(), spec_b.create()
+    players = [player_a, player_b] if a_first else [player_b, player_a]
+
+    start_time = time.time()
+    plies = -1
+    played_game = game_module.new_game(players)  # Without observers, nothing is printed
+    for _state in played_game.play():
+        plies += 1
+
+    winner = played_game.get_winner()
+    result = DRAW if winner is None else WIN if winner is player_a else LOSS
+    return GameResult(index, result, plies, time.time() - start_time, a_first)
+
+
+def _play_game_args(args):
+    return play_game(*args)
+
+
+def play_games(games_args, processes=None):
+    """ Yield the results of the games, each given as the arguments of play_game(), as they finish """
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(_play_game_args, games_args)
+
+
+def run_arena(game_module_name, spec_a: PlayerSpec, spec_b: PlayerSpec, games, processes=None, swap_sides=True,
+              seed=None):
+    """ Yield the results of the games as they finish """
+    yield from play_games([(game_module_name, spec_a, spec_b, index, not swap_sides or index % 2 == 0, seed)
+                           for index in range(games)],
+                          processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many games between two players.')
+    parser.add_argument('game', help='The game module, e.g. four_in_a_row')
+    parser.add_argument('player_a', help='Player A as a call, e.g. "four_in_a_row.FourInRowAiPlayer(\'X\')"')
+    parser.add_argument('player_b', help='Player B as a call')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--no-swap', action='store_true', help='Player A always plays first')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    spec_a, spec_b = PlayerSpec.parse(args.player_a), PlayerSpec.parse(args.player_b)
+    print(f'A: {spec_a}\nB: {spec_b}')
+
+    stats = ArenaStats()
+    for result in run_arena(args.game, spec_a, spec_b, args.games, args.processes, not args.no_swap, args.seed):
+        stats.add(result)
+        print(f'{result}\n\t{stats}')
+
+    print(f'\n{stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Micro benchmarks of the game states.
+
+Usage:
+    python benchmarks.py four_in_a_row
+"""
+import argparse
+import random
+import time
+
+import game
+
+
+def perft(state: game.GameState, depth):
+    """ Count the positions reachable in exactly depth moves (a game ends when someone wins) """
+    if depth == 0:
+        return 1
+
+    if state.get_winner() is not None:
+        return 0
+
+    return sum(perft(state.move(move), depth - 1) for move in state.get_moves())
+
+
+def random_playout(state: game.GameState):
+    plies = 0
+    while state.get_winner() is None:
+        moves = list(state.get_moves())
+        if not moves:
+            break
+
+        state = state.move(random.choice(moves))
+        plies += 1
+
+    return plies
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def compare_states(states, perft_depth, playouts):
+    """ Run perft and random playouts from each of the named start states """
+    for name, state in states:
+        nodes, secs = timed(perft, state, perft_depth)
+        print(f'{name:20} perft({perft_depth}) = {nodes} in {secs:.2f}s ({nodes / secs:,.0f} nodes/s)')
+
+        random.seed(0)
+        plies, secs = timed(lambda: sum(random_playout(state) for _ in range(playouts)))
+        print(f'{name:20} {playouts} playouts ({plies} plies) in {secs:.2f}s ({playouts / secs:,.0f} playouts/s)')
+
+        childs = [state.move(move) for move in state.get_moves()]
+        evals, secs = timed(lambda: [child.eval() for child in childs for _ in range(1000)])
+        print(f'{name:20} {len(evals)} evals in {secs:.3f}s ({len(evals) / secs:,.0f} evals/s)')
+
+
+def compare_batch(name, state: game.GameState, batch_class, playouts):
+    """ Random playouts from the state one at a time, and all at once in a game.BatchGameState """
+    import numpy as np
+
+    random.seed(0)
+    scalar_playouts = playouts // 10
+    plies, secs = timed(lambda: sum(random_playout(state) for _ in range(scalar_playouts)))
+    print(f'{name:20} {scalar_playouts} playouts ({plies} plies) in {secs:.2f}s '
+          f'({scalar_playouts / secs:,.0f} playouts/s)')
+
+    batch = batch_class.from_state(state, playouts)
+    _winners, secs = timed(batch.play_random, np.random.default_rng(0))
+    print(f'{batch_class.__name__:20} {playouts} playouts ({batch.plies().sum()} plies) in {secs:.2f}s '
+          f'({playouts / secs:,.0f} playouts/s)')
+
+
+def bench_four_in_a_row(perft_depth=6, playouts=2000):
+    import four_in_a_row
+
+    players = [game.PlaceholderPlayer(four_in_a_row.HUMAN_CHAR), game.PlaceholderPlayer(four_in_a_row.AI_CHAR)]
+    state = four_in_a_row.new_game(players).m_state
+    compare_states([('FourInRowState', state),
+                    ('FourInRowBitState', four_in_a_row.FourInRowBitState.from_state(state))],
+                   perft_depth, playouts)
+
+
+def bench_five_in_row(perft_depth=4, playouts=100):
+    import five_in_row
+
+    players = [game.PlaceholderPlayer(five_in_row.HUMAN_CHAR), game.PlaceholderPlayer(five_in_row.AI_CHAR)]
+    compare_states([(f'FiveInRow {size}x{size} r{radius}',
+                     five_in_row.new_game(players, rows=size, cols=size, radius=radius).m_state)
+                    for size in (9, 15, 19) for radius in (1, 2)],
+                   perft_depth, playouts)
+
+
+def bench_huge_tic_tac_toe(perft_depth=5, playouts=2000):
+    import huge_tic_tac_toe
+
+    players = [game.PlaceholderPlayer(huge_tic_tac_toe.HUMAN_CHAR), game.PlaceholderPlayer(huge_tic_tac_toe.AI_CHAR)]
+    compare_states([('HugeTicTacState', huge_tic_tac_toe.new_game(players).m_state)], perft_depth, playouts)
+
+
+def bench_four_in_a_row_batch(playouts=4096):
+    import four_in_a_row
+    import four_in_a_row_batch
+
+    players = [game.PlaceholderPlayer(four_in_a_row.HUMAN_CHAR), game.PlaceholderPlayer(four_in_a_row.AI_CHAR)]
+    state = four_in_a_row.new_game(players, bitboard=True).m_state
+    random.seed(0)
+    plies, secs = timed(lambda: sum(random_playout(state) for _ in range(playouts // 4)))
+    print(f'{"one at a time":20} {playouts // 4} playouts ({plies} plies) in {secs:.2f}s '
+          f'({playouts // 4 / secs:,.0f} playouts/s)')
+
+    rollout = four_in_a_row_batch.BatchRollout(playouts, seed=0)
+    (_winners, plies), secs = timed(rollout.play, state)
+    print(f'{"lockstep numpy":20} {playouts} playouts ({plies.sum()} plies) in {secs:.2f}s '
+          f'({playouts / secs:,.0f} playouts/s)')
+
+
+def bench_batch(playouts=10000):
+    import four_in_a_row
+    import four_in_a_row_batch
+    import huge_tic_tac_toe
+    import huge_tic_tac_toe_batch
+    import tic_tac_toe
+    import tic_tac_toe_batch
+
+    players = [game.PlaceholderPlayer(tic_tac_toe.HUMAN_CHAR), game.PlaceholderPlayer(tic_tac_toe.AI_CHAR)]
+    compare_batch('TicTacState', tic_tac_toe.new_game(players).m_state, tic_tac_toe_batch.TicTacBatchState, playouts)
+    compare_batch('HugeTicTacState', huge_tic_tac_toe.new_game(players).m_state,
+                  huge_tic_tac_toe_batch.HugeTicTacBatchState, playouts)
+    compare_batch('FourInRowBitState', four_in_a_row.new_game(players, bitboard=True).m_state,
+                  four_in_a_row_batch.FourInRowBatchState, playouts)
+
+
+BENCHMARKS = {
+    'four_in_a_row': bench_four_in_a_row,
+    'four_in_a_row_batch': bench_four_in_a_row_batch,
+    'five_in_row': bench_five_in_row,
+    'huge_tic_tac_toe': bench_huge_tic_tac_toe,
+    'batch': bench_batch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game states.')
+    parser.add_argument('benchmarks', nargs='*', help=f'Any of: {", ".join(BENCHMARKS)} (default: all)')
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'Unknown benchmark {name}')
+
+    for name in args.benchmarks or BENCHMARKS:
+        print(f'[{name}]')
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
 import math
 import random
+import struct
 import threading
 import time
 
+import game
+import minimax
 from game import GameState, Player
 
 
@@ -22,37 +25,113 @@ def timeit(method):
 
 
 SEARCH_CONST = 2  # math.sqrt(2)
+WIN_SCORE = 1000  # A win scores WIN_SCORE minus its depth, a loss the negative
+SCORE_SCALE = 1000  # The selection priority takes the average scores divided by SCORE_SCALE
+TRUNCATED_SCORE = 500  # A truncated rollout scores TRUNCATED_SCORE * tanh(eval / eval scale), below any win
+EVAL_SCALE = 100
 INF = 0xFFFFFFFF  # float("inf")
 TIE_SCORE = 0
 
 g_depths = []
 g_statics = 0
 
+TREE_MAGIC = b'MCTS'
+TREE_VERSION = 2
+TREE_HEADER = struct.Struct('<4sB?')  # magic, version, is the root a max player
+# The move from the parent (its index in the sorted moves of the parent, see _sorted_moves), childs number, visits,
+# total, static value (NaN if there is none)
+TREE_NODE = struct.Struct('<HHIdd')
+NO_MOVE_INDEX = 0xFFFF  # The move index of the root
+
 
 class CarloMontePlayer(Player):
-    def __init__(self, iterations=2000, secs=None, think_ahead=False):
+    def __init__(self, iterations=2000, secs=None, think_ahead=False, rollout_depth=None, eval_scale=EVAL_SCALE,
+                 rollout=None, symmetry=False, minimax_depth=None, tactical_rollouts=False, progressive_bias=None,
+                 search_const=SEARCH_CONST, win_score=WIN_SCORE, score_scale=SCORE_SCALE):
+        """
+        rollout_depth - stop the random playouts after that many moves and score them by the state's eval_for()
+        rollout - replaces the random playout of a leaf, rollout(state, player, depth) -> score for the player
+                  (e.g. four_in_a_row_batch.BatchRollout, the average of many playouts)
+        symmetry - expand only one of the moves that lead to symmetric states (by the states' canonical_key()),
+                   they have the same value so their statistics are shared
+        minimax_depth - search new nodes with a shallow minimax first (1 or 2), a node it proves won or lost is not
+                        simulated and keeps that value, so the tree avoids moves that lose right away
+        tactical_rollouts - the random playouts take a winning move whenever there is one
+        progressive_bias - the weight of a prior from the childs' eval_for(), added to their priority and decaying as
+                           1 / (visits + 1). The childs are also visited for the first time in the order of the prior.
+        search_const, win_score, score_scale - the search constants, see tune.py
+        """
         self.iterations = iterations
         self.secs = secs
         self.think_ahead = think_ahead
+        self.rollout_depth = rollout_depth
+        self.eval_scale = eval_scale
+        self.rollout = rollout
+        self.symmetry = symmetry
+        self.minimax_depth = minimax_depth
+        self.tactical_rollouts = tactical_rollouts
+        self.progressive_bias = progressive_bias
+        self.search_const = search_const
+        self.win_score = win_score
+        self.score_scale = score_scale
         self.root = None
 
+        self.ponder_thread = None
+        self.ponder_guess = None  # The opponent's move pondering found the most promising, as a node
+        self.pondered = False
+        self.last_ponder_hit = None
+        self.reused_visits = 0
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+
     def get_root_for_state(self, state):
         if self.root is not None:
+            if self.root.state == state:
+                return self.root
+
             for child in self.root.childs:
                 if child.state == state:
-                    new_root = child
-                    new_root.parent = None
-                    new_root.depth = 0
-                    return new_root
+                    return self._detach_root(child)
+
+            # With symmetry a move may have been left out for a symmetric one, whose tree is searched instead
+            key = state.canonical_key() if self.symmetry else None
+            if key is not None:
+                if self.root.state.canonical_key() == key:
+                    return self.root
+
+                for child in self.root.childs:
+                    if child.state.canonical_key() == key:
+                        return self._detach_root(child)
 
         return CarloMonteTreeNode(state, player=self)
 
+    @staticmethod
+    def _detach_root(node):
+        node.parent = None
+        node.depth = 0
+        return node
+
     def get_move(self, state):
+        self.stop_pondering()
         if self.root:
             self.root.set_stop_calc()
 
         self.root = self.get_root_for_state(state)
+        # The root may be the one that was just stopped (the loaded tree, or the same state again)
+        self.root.stop_calc = False
+        self.reused_visits = self.root.visits
+        self.last_ponder_hit = None
+        if self.pondered:
+            self.last_ponder_hit = self.root is self.ponder_guess
+            if self.last_ponder_hit:
+                self.ponder_hits += 1
+            else:
+                self.ponder_misses += 1
 
+            self.pondered = False
+            self.ponder_guess = None
+
+        searched_state = self.root.state
         if self.secs:
             self.root = self.root.calc_best_move_in_time(self.secs)
         else:
@@ -61,8 +140,77 @@ class CarloMontePlayer(Player):
         if self.think_ahead:
             self.root.calc_best_move_until_stop()
 
+        if searched_state is not state and not searched_state == state:
+            # The tree of a symmetric state, the move is mapped back to the orientation of the state
+            return state.from_canonical_move(searched_state.canonical_move(self.root.move))
+
         return self.root.move
 
+    def ponder(self, state):
+        """ Search the opponent's position in a background thread, the tree is reused by the next get_move() """
+        self.stop_pondering()
+        if self.root:
+            self.root.set_stop_calc()
+
+        root = self.get_root_for_state(state)
+        if root.state.get_winner() is not None or root.state.no_moves():
+            return
+
+        self.root = root
+        self.root.stop_calc = False
+        self.ponder_thread = threading.Thread(target=self.root.calc_best_move, args=[INF], daemon=True)
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        if self.ponder_thread is None:
+            return
+
+        self.root.set_stop_calc()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_guess = max(self.root.childs, key=lambda node: node.visits, default=None)
+        self.pondered = True
+
+    def get_search_stats(self):
+        if self.root is None or self.root.parent is None or self.root.parent.search_stats is None:
+            return None
+
+        return {'visits': self.root.visits,
+                'score': self.root.get_score(),
+                'total_visits': self.root.parent.visits,
+                'reused_visits': self.reused_visits,
+                'ponder_hit': self.last_ponder_hit,
+                **self.root.parent.search_stats}
+
+    def describe_search(self):
+        if self.root is None or self.root.parent is None or self.root.parent.search_stats is None:
+            return ''
+
+        return self.root.parent.describe_search(self.root)
+
+    def save_tree(self, path, max_depth=None):
+        save_tree(self.root, path, max_depth)
+
+    def load_tree(self, path, state):
+        if self.root:
+            self.root.set_stop_calc()
+
+        self.root = load_tree(path, state, player=self)
+
+
+class CarloMonteCharPlayer(CarloMontePlayer):
+    """ A Monte Carlo player of any game that only needs the char of its players """
+
+    def __init__(self, char, iterations=2000, secs=None, **kwargs):
+        super().__init__(iterations, secs, **kwargs)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
+
 
 class CarloMonteTreeNode:
     def __init__(self, state: GameState,
@@ -76,10 +224,12 @@ class CarloMonteTreeNode:
         self.visits = 0
         self.childs: [GameState] = []
         self.static_value = None
+        self.prior = 0  # The progressive bias, in the scale of get_score() / score scale
         self.selection_func = max if self.max_player else min
         self.player = player
 
         self.stop_calc = False
+        self.search_stats = None
 
     def get_score(self) -> float:
         if self.static_value is not None:
@@ -102,9 +252,13 @@ class CarloMonteTreeNode:
         if self.parent is None:
             print(self)
 
-        # Avg score + How much did we explore here
-        return self.get_score() / 1000 + \
-               (SEARCH_CONST if self.parent.max_player else -SEARCH_CONST) * \
+        player = self.player
+        search_const, score_scale = (SEARCH_CONST, SCORE_SCALE) if player is None else \
+            (player.search_const, player.score_scale)
+
+        # Avg score + The eval prior, fading with visits + How much did we explore here
+        return self.get_score() / score_scale + self.prior / (self.visits + 1) + \
+               (search_const if self.parent.max_player else -search_const) * \
                math.sqrt(math.log(self.parent.visits) / self.visits)
 
     def next_node(self) -> 'CarloMonteTreeNode':
@@ -113,7 +267,8 @@ class CarloMonteTreeNode:
 
         return self.selection_func(self.childs, key=lambda node: node.priority()).next_node()
 
-    def create_childs(self):
+    def create_childs(self, symmetry=None):
+        """ symmetry - leave out the symmetric childs, by default if the player does """
         assert not self.childs, 'Fuck i have childs :('
 
         self.childs = [CarloMonteTreeNode(self.state.move(move),
@@ -124,17 +279,39 @@ class CarloMonteTreeNode:
                                           self.player)
                        for move in self.state.get_moves()]
 
+        if symmetry is None:
+            symmetry = self.player is not None and self.player.symmetry
+        if symmetry:
+            # Symmetric childs have the same value, the first of each is kept
+            unique_childs = {}
+            for child in self.childs:
+                key = child.state.canonical_key()
+                unique_childs.setdefault(id(child) if key is None else key, child)
+            self.childs = list(unique_childs.values())
+
+        if self.player is not None and self.player.progressive_bias:
+            # The unvisited childs are selected in order, so the most promising ones by the evaluation come first
+            for child in self.childs:
+                child.prior = self.player.progressive_bias * \
+                              math.tanh(child.state.eval_for(self.player) / self.player.eval_scale)
+            self.childs.sort(key=lambda child: child.prior, reverse=self.max_player)
+
     # @timeit
     def simulate(self) -> float:
         # ts = time.time()
+        if self.player is not None and self.player.rollout is not None:
+            return self.player.rollout(self.state, self.player, self.depth)
 
         curr_state = self.state
         ret = None
+        rollout_depth = INF if self.player is None or self.player.rollout_depth is None else self.player.rollout_depth
+        tactical = self.player is not None and self.player.tactical_rollouts
         for i in range(INF):
             winner = curr_state.get_winner()
             if winner is not None:
                 g_depths.append(i)
-                ret = 1000 - i - self.depth if winner == self.player else - 1000 + i + self.depth
+                win_score = self.win_score()
+                ret = win_score - i - self.depth if winner == self.player else - win_score + i + self.depth
                 break
 
             moves = list(curr_state.get_moves())
@@ -145,7 +322,16 @@ class CarloMonteTreeNode:
                 ret = TIE_SCORE
                 break
 
-            move = random.choice(moves)
+            if i >= rollout_depth:
+                # Truncated, the evaluation is kept below the score of any actual win
+                g_depths.append(i)
+                ret = TRUNCATED_SCORE * self.player.win_score / WIN_SCORE * \
+                    math.tanh(curr_state.eval_for(self.player) / self.player.eval_scale)
+                break
+
+            move = curr_state.get_winning_move() if tactical else None
+            if move is None:
+                move = random.choice(moves)
             curr_state = curr_state.move(move)
             assert curr_state is not None
 
@@ -153,6 +339,39 @@ class CarloMonteTreeNode:
         # print('%2.2f ms, depth %d. (%2.2f per move).' % ((te - ts) * 1000, i, (te - ts) * 1000 / i))
         return ret
 
+    def evaluate(self) -> float:
+        """ The score of a new node: its value if a shallow minimax proves it, otherwise a simulation """
+        global g_statics
+
+        if self.player is not None and self.player.minimax_depth:
+            value = self.minimax_value(self.player.minimax_depth)
+            if value is not None:
+                self.static_value = value
+                g_statics += 1
+                return value
+
+        return self.simulate()
+
+    def minimax_value(self, depth):
+        """ The value of the node if minimax to the depth finds a forced win or loss, None otherwise """
+        _move, score = minimax.minimax_alpha_beta([], self.state, self.state.get_curr_player(), depth)
+        if abs(score) <= minimax.INF // 2:  # An evaluation, not a result
+            return None
+
+        return self.solved_value(game.SOLVED_WIN if score > 0 else game.SOLVED_LOSS, minimax.INF - abs(score))
+
+    def win_score(self):
+        return WIN_SCORE if self.player is None else self.player.win_score
+
+    def solved_value(self, result, plies):
+        if result == game.SOLVED_DRAW:
+            return TIE_SCORE
+
+        depth = self.depth + plies
+        player_wins = (result == game.SOLVED_WIN) == (self.state.get_curr_player() == self.player)
+        win_score = self.win_score()
+        return win_score - depth if player_wins else - win_score + depth
+
     def update(self, score: float):
         curr_node = self
         while curr_node:
@@ -164,9 +383,17 @@ class CarloMonteTreeNode:
         global g_statics
 
         winner = self.state.get_winner()
+        solution = self.state.get_solution() if winner is None else None
         if winner is not None:
             """ Terminal state """
-            self.static_value = 1000 - self.depth if winner == self.player else - 1000 + self.depth
+            win_score = self.win_score()
+            self.static_value = win_score - self.depth if winner == self.player else - win_score + self.depth
+            to_simulate = self
+            score = self.static_value
+            g_statics += 1
+        elif solution is not None:
+            """ Solved state, its value is known without simulating """
+            self.static_value = self.solved_value(*solution)
             to_simulate = self
             score = self.static_value
             g_statics += 1
@@ -174,7 +401,7 @@ class CarloMonteTreeNode:
             if self.visits == 0:
                 """ Never visited, simulate here """
                 to_simulate = self
-                score = to_simulate.simulate()
+                score = to_simulate.evaluate()
             else:
                 """ Expand """
                 self.create_childs()
@@ -186,27 +413,32 @@ class CarloMonteTreeNode:
                     """ Simulate newly expanded child """
                 else:
                     to_simulate = self.childs[0]
-                    score = to_simulate.simulate()
+                    score = to_simulate.evaluate()
 
         # print(f'State:\n{self.state}\nScore: {score}\n')
 
         """ Update """
         to_simulate.update(score)
 
-    @timeit
     def calc_best_move(self, iterations_num):
         global g_depths, g_statics
         g_depths = []
         g_statics = 0
+        start_time = time.time()
 
         if not self.childs:
             self.create_childs()
 
+        iterations_counter = 0
         for iterations_counter in range(iterations_num):
             next_node = self.next_node()
             next_node.expend_simulate_update()
             if self.stop_calc:
-                print(f'Simulated {iterations_counter} iterations.')
+                break
+
+            # Nothing left to search once the values of all the moves are known
+            if next_node.parent is self and next_node.static_value is not None and \
+                    all(child.static_value is not None for child in self.childs):
                 break
 
             # if iterations_counter == iterations_num - 1 or iterations_counter % 200 == 0:
@@ -224,17 +456,22 @@ class CarloMonteTreeNode:
 
         best_move = max(self.childs, key=lambda node: node.get_score())
 
-        print(f'Self: {self}')
-        total_visits = sum(child.visits for child in self.childs)
-        print(f'Total visits: {total_visits}')
-        print(f'Statics: {g_statics}')
-        print(f'Chose {best_move}.')
-        if g_depths:
-            print(f'Avg Depth: {sum(g_depths) / len(g_depths)}')
-        childs_str = "\n\t".join(repr(child) for child in self.childs)
-        print(f'{iterations_counter}:\n\t{childs_str}')
+        self.search_stats = {'iterations': iterations_counter + 1,
+                             'ms': int((time.time() - start_time) * 1000),
+                             'statics': g_statics,
+                             'avg_depth': sum(g_depths) / len(g_depths) if g_depths else None}
         return best_move
 
+    def describe_search(self, best_move):
+        childs_str = "\n\t".join(repr(child) for child in self.childs)
+        return f'Self: {self}\n' \
+               f'Total visits: {sum(child.visits for child in self.childs)}\n' \
+               f'Statics: {self.search_stats["statics"]}\n' \
+               f'Chose {best_move}.\n' \
+               f'Avg Depth: {self.search_stats["avg_depth"]}\n' \
+               f'Took {self.search_stats["ms"]} ms.\n' \
+               f'{self.search_stats["iterations"]}:\n\t{childs_str}'
+
     def set_stop_calc(self):
         self.stop_calc = True
 
@@ -255,3 +492,74 @@ class CarloMonteTreeNode:
                f'Total: {self.total}, Visits: {self.visits} (={self.get_score()}), ' \
                f'Childs: {len(self.childs)} | ' \
                f'Priority: {0 if self.parent is None else self.priority()}>'
+
+
+def _sorted_moves(state: GameState):
+    """ The moves of the state in an order that does not depend on how the state was reached or the player's options """
+    return sorted(state.get_moves(), key=lambda move: repr(state.encode_move(move)))
+
+
+def save_tree(root: CarloMonteTreeNode, path, max_depth=None):
+    """
+    Write the statistics of the tree (or only its top max_depth levels) to a binary file.
+    The states themselves are not saved, the childs are recreated from the root state when the tree is loaded and
+    matched to the saved statistics by their moves.
+    """
+    with open(path, 'wb') as f:
+        f.write(TREE_HEADER.pack(TREE_MAGIC, TREE_VERSION, root.max_player))
+
+        nodes = [(root, 0, NO_MOVE_INDEX)]
+        while nodes:
+            node, depth, move_index = nodes.pop()
+            childs = node.childs if max_depth is None or depth < max_depth else []
+            static_value = math.nan if node.static_value is None else node.static_value
+            f.write(TREE_NODE.pack(move_index, len(childs), node.visits, node.total, static_value))
+            if childs:
+                move_indexes = {move: index for index, move in enumerate(_sorted_moves(node.state))}
+                nodes.extend((child, depth + 1, move_indexes[child.move]) for child in reversed(childs))
+
+
+def load_tree(path, state: GameState, player=None) -> CarloMonteTreeNode:
+    """ Raises ValueError if the snapshot does not match the state, or the childs the player creates """
+    with open(path, 'rb') as f:
+        magic, version, max_player = TREE_HEADER.unpack(f.read(TREE_HEADER.size))
+        if magic != TREE_MAGIC or version != TREE_VERSION:
+            raise ValueError(f'{path} is not a tree snapshot')
+
+        def read_node():
+            data = f.read(TREE_NODE.size)
+            if len(data) != TREE_NODE.size:
+                raise ValueError(f'Tree snapshot {path} is truncated')
+
+            return TREE_NODE.unpack(data)
+
+        def load_statistics(node, childs_number, visits, total, static_value):
+            """ Returns the slots of the node's saved childs: the node and its childs that were not loaded yet """
+            node.visits, node.total = visits, total
+            node.static_value = None if math.isnan(static_value) else static_value
+            if not childs_number:
+                return []
+
+            moves = _sorted_moves(node.state)
+            # Only the symmetric childs are ever left out, whatever the options of the player that saved the tree are
+            node.create_childs(symmetry=childs_number < len(moves))
+            move_indexes = {move: index for index, move in enumerate(moves)}
+            unloaded = {move_indexes[child.move]: child for child in node.childs}
+            if len(unloaded) != childs_number:
+                raise ValueError(f'Tree snapshot {path} does not match the given state')
+
+            return [unloaded] * childs_number
+
+        root = CarloMonteTreeNode(state, max_player=max_player, player=player)
+        _move_index, *statistics = read_node()
+        slots = load_statistics(root, *statistics)
+        while slots:
+            unloaded = slots.pop()
+            move_index, *statistics = read_node()
+            child = unloaded.pop(move_index, None)
+            if child is None:
+                raise ValueError(f'Tree snapshot {path} does not match the given state')
+
+            slots.extend(load_statistics(child, *statistics))
+
+    return root
@@ -0,0 +1,340 @@
+"""
+A long running engine service: best moves for encoded states of any bundled game, over TCP or a Unix socket.
+
+Requests and responses are JSON objects, one per line. Responses carry the request's "id" and may come back in any
+order on a connection.
+    {"id": 1, "game": "four_in_a_row", "chars": ["O", "X"], "state": <base64 of to_bytes()>,
+     "session": "game-17", "engine": "mcts", "ms": 500}
+        -> {"id": 1, "move": <encoded move>, "stats": {...}, "ms": <latency>}
+    {"id": 2, "type": "end", "session": "game-17"}  Forget the session's search trees
+    {"id": 3, "type": "stats"}  Queue depth, sessions and latency percentiles
+
+The engine is "mcts" (with "ms" or "iterations", and optionally "rollout_depth", "symmetry", "minimax_depth" and
+"tactical_rollouts") or "minimax" (with "depth").
+Every session is pinned to one worker process, which keeps the session's players, and so their search trees, between
+the moves of the game. Every request has its own budget, the players are created again if its other options change.
+
+Example:
+    python engine_service.py --tcp 127.0.0.1:8765 -j 4
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import importlib
+import json
+import os
+import socket
+import time
+
+import carlo_monte
+import game
+import minimax
+
+BUNDLED_GAMES = {
+    'tic_tac_toe': 'tic_tac_toe.TicTacState',
+    'huge_tic_tac_toe': 'huge_tic_tac_toe.HugeTicTacState',
+    'four_in_a_row': 'four_in_a_row.FourInRowState',
+    'four_in_a_row_bitboard': 'four_in_a_row.FourInRowBitState',
+    'five_in_row': 'five_in_row.FiveInRowState',
+    'santorini': 'santorini.SantoriniState',
+    'dividers': 'DividersGame.DividersState',
+}
+
+MCTS = 'mcts'
+MINIMAX = 'minimax'
+DEFAULT_ITERATIONS = 2000
+DEFAULT_DEPTH = 4
+
+# The options of a request that make a different player, and their defaults. The budget (iterations or ms, depth) may
+# change on every request.
+ENGINE_OPTIONS = {'engine': MCTS, 'rollout_depth': None, 'symmetry': False, 'minimax_depth': None,
+                  'tactical_rollouts': False}
+
+MAX_SESSIONS_PER_WORKER = 256  # The least recently used sessions of a worker are forgotten beyond that
+LATENCY_WINDOW = 1000  # The latency percentiles are of the last requests
+
+# In each worker process: session -> {player index: (engine key, player)}, the least recently used first
+_session_players = collections.OrderedDict()
+
+
+def _state_class(game_name):
+    if game_name not in BUNDLED_GAMES:
+        raise ValueError(f'Unknown game {game_name}')
+
+    module_name, class_name = BUNDLED_GAMES[game_name].rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _warm_up():
+    for game_name in BUNDLED_GAMES:
+        _state_class(game_name)
+
+    return os.getpid()
+
+
+def create_engine_player(char, options) -> game.Player:
+    """
+    A player of any game by the engine options of a request: engine, iterations or ms, rollout_depth, symmetry,
+    minimax_depth, tactical_rollouts (see CarloMontePlayer), depth
+    """
+    engine = options.get('engine', MCTS)
+    if engine == MCTS:
+        ms = options.get('ms')
+        return carlo_monte.CarloMonteCharPlayer(char, options.get('iterations', DEFAULT_ITERATIONS),
+                                                secs=ms / 1000 if ms else None,
+                                                rollout_depth=options.get('rollout_depth'),
+                                                symmetry=options.get('symmetry', False),
+                                                minimax_depth=options.get('minimax_depth'),
+                                                tactical_rollouts=options.get('tactical_rollouts', False))
+    if engine == MINIMAX:
+        return minimax.MinimaxCharPlayer(char, options.get('depth', DEFAULT_DEPTH))
+
+    raise ValueError(f'Unknown engine {engine}')
+
+
+def set_engine_budget(player, options):
+    """ Apply the budget options of a request (iterations or ms, depth) to a player of create_engine_player() """
+    if isinstance(player, carlo_monte.CarloMontePlayer):
+        ms = options.get('ms')
+        player.iterations = options.get('iterations', DEFAULT_ITERATIONS)
+        player.secs = ms / 1000 if ms else None
+    else:
+        player.depth = options.get('depth', DEFAULT_DEPTH)
+
+
+def _engine_key(options):
+    """ The options that make a different player, a session's player is created again when they change """
+    return tuple(options.get(name, default) for name, default in ENGINE_OPTIONS.items())
+
+
+def _best_move(request):
+    """
+    Runs in the worker process of the request's session.
+    The session is used before anything can fail, so the LRU order stays the same as EngineService's.
+    """
+    session = request.get('session')
+    session_players = {}
+    if session is not None:
+        session_players = _session_players.setdefault(session, {})
+        _session_players.move_to_end(session)
+        while len(_session_players) > MAX_SESSIONS_PER_WORKER:
+            _session_players.popitem(last=False)
+
+    players = [game.PlaceholderPlayer(char) for char in request['chars']]
+    state = _state_class(request['game']).from_bytes(base64.b64decode(request['state']), players)
+    index = state.m_curr_player_index
+
+    engine_key = _engine_key(request)
+    engine_key_and_player = session_players.get(index)
+    if engine_key_and_player is None or engine_key_and_player[0] != engine_key:
+        player = create_engine_player(players[index].get_char(), request)
+        session_players[index] = engine_key, player
+    else:
+        player = engine_key_and_player[1]
+        set_engine_budget(player, request)  # Every request has its own budget
+
+    players[index] = player  # The decoded states share the list
+    move = player.get_move(state)
+    return {'move': state.encode_move(move), 'stats': player.get_search_stats()}
+
+
+def _end_session(session):
+    _session_players.pop(session, None)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Worker:
+    """ A single warm process, so a session's requests always reach the process that has its trees """
+
+    def __init__(self):
+        self.executor = concurrent.futures.ProcessPoolExecutor(1)
+        self.pending = 0
+        # The sessions pinned to the worker, the least recently used first, like _session_players in its process
+        self.sessions = collections.OrderedDict()
+
+    async def run(self, func, *args):
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+
+class EngineService:
+    def __init__(self, processes=None):
+        self.workers = [Worker() for _ in range(processes or os.cpu_count())]
+        self.session_workers = {}
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+
+    async def start(self, tcp=None, unix=None):
+        await asyncio.gather(*(worker.run(_warm_up) for worker in self.workers))
+        if unix:
+            self.server = await asyncio.start_unix_server(self.handle_connection, unix)
+        else:
+            host, port = tcp
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_forever(self, tcp=None, unix=None):
+        await self.start(tcp, unix)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for worker in self.workers:
+            worker.executor.shutdown()
+
+    def _worker_for(self, session) -> Worker:
+        if session is None:
+            return min(self.workers, key=lambda worker: worker.pending)
+
+        worker = self.session_workers.get(session)
+        if worker is None:
+            worker = min(self.workers, key=lambda worker: (len(worker.sessions), worker.pending))
+            self.session_workers[session] = worker
+
+        # The worker forgets the same sessions, in the same order, as its requests run one at a time
+        worker.sessions[session] = None
+        worker.sessions.move_to_end(session)
+        while len(worker.sessions) > MAX_SESSIONS_PER_WORKER:
+            evicted, _ = worker.sessions.popitem(last=False)
+            del self.session_workers[evicted]
+
+        return worker
+
+    async def handle_connection(self, reader, writer):
+        tasks = set()
+        try:
+            async for line in reader:
+                if line.strip():
+                    task = asyncio.create_task(self.handle_line(line, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+        writer.close()
+
+    async def handle_line(self, line, writer):
+        start_time = time.perf_counter()
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                request = {}
+                raise ValueError('A request is a JSON object')
+
+            response = await self.handle_request(request)
+        except Exception as e:  # A bad request must not take the service down
+            self.errors += 1
+            response = {'error': f'{type(e).__name__}: {e}'}
+
+        latency = (time.perf_counter() - start_time) * 1000
+        if request.get('type', 'move') == 'move' and 'error' not in response:
+            self.latencies.append(latency)
+
+        response = {'id': request.get('id'), **response, 'ms': round(latency, 1)}
+        try:
+            writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle_request(self, request):
+        self.requests += 1
+        request_type = request.get('type', 'move')
+        if request_type == 'move':
+            return await self._worker_for(request.get('session')).run(_best_move, request)
+        if request_type == 'end':
+            worker = self.session_workers.pop(request['session'], None)
+            if worker is not None:
+                del worker.sessions[request['session']]
+                await worker.run(_end_session, request['session'])
+            return {}
+        if request_type == 'stats':
+            return self.get_stats()
+
+        raise ValueError(f'Unknown request type {request_type}')
+
+    def get_stats(self):
+        latencies = sorted(round(latency, 1) for latency in self.latencies)
+        return {'queue_depth': sum(worker.pending for worker in self.workers),
+                'workers': [{'pending': worker.pending, 'sessions': len(worker.sessions)} for worker in self.workers],
+                'sessions': len(self.session_workers),
+                'requests': self.requests,
+                'errors': self.errors,
+                'latency_ms': {'p50': percentile(latencies, 0.5),
+                               'p90': percentile(latencies, 0.9),
+                               'p99': percentile(latencies, 0.99),
+                               'max': latencies[-1] if latencies else None}}
+
+
+class EngineClient:
+    """ A blocking client, one request at a time. The address is "host:port" or the path of a Unix socket. """
+
+    def __init__(self, address):
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            self.socket = socket.create_connection((host, int(port)))
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(address)
+
+        self.file = self.socket.makefile('rwb')
+        self.next_id = 0
+
+    def request(self, **request) -> dict:
+        self.next_id += 1
+        self.file.write(json.dumps({'id': self.next_id, **request}).encode() + b'\n')
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def best_move(self, game_name, state: game.GameState, session=None, **options):
+        response = self.request(game=game_name,
+                                chars=[player.get_char() for player in state.m_players],
+                                state=base64.b64encode(state.to_bytes()).decode('ascii'),
+                                session=session,
+                                **options)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+
+        return state.decode_move(response['move'])
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve best moves of the bundled games.')
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--tcp', help='host:port')
+    address.add_argument('--unix', help='The path of a Unix socket')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    tcp = None
+    if args.tcp:
+        host, port = args.tcp.rsplit(':', 1)
+        tcp = (host, int(port))
+
+    asyncio.run(EngineService(args.processes).serve_forever(tcp, args.unix))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import functools
+import struct
 from string import ascii_uppercase
 
 import game
@@ -10,6 +12,18 @@ AI_CHAR = 'X'
 AMOUNT_IN_A_ROW = 5
 ROWS = 9
 COLS = 9
+RADIUS = 1  # Only cells this close to a stone are considered as moves
+
+# Threat scores of the line patterns eval looks for
+FIVE_SCORE = 10_000
+OPEN_FOUR_SCORE = 5_000  # _XXXX_
+OPEN_THREE_SCORE = 500  # _XXX__, _XX_X_ and their mirrors
+OPEN_TWO_SCORE = 40  # __XX__, _XX___, _X_X__ and their mirrors
+# A window of 5 cells without the other player's stones, by the amount of stones in it
+WINDOW_SCORES = [0, 1, 5, 50, 600, FIVE_SCORE]
+
+NO_LAST_MOVE = 0xFFFF
+BYTES_HEADER = struct.Struct('<BBBBH')  # rows, cols, radius, player index, last move cell index
 
 
 class FiveInRowHumanPlayer(game.Player):
@@ -30,7 +44,7 @@ class FiveInRowHumanPlayer(game.Player):
                     return row, col
             except ValueError:
                 print('Illegal move. ', end='')
-            print(f'Enter your move (Row: 1-{ROWS}, Col: A-{ascii_uppercase[COLS - 1]}): ', end='')
+            print(f'Enter your move (Row: 1-{state.rows}, Col: A-{ascii_uppercase[state.cols - 1]}): ', end='')
 
     def notify_bad_move(self):
         print('Illegal move.')
@@ -40,8 +54,138 @@ class FiveInRowHumanPlayer(game.Player):
 
 
 class FiveInRowAiPlayer(CarloMontePlayer):  # minimax.MinimaxPlayer):
-    def __init__(self, char):
-        super().__init__(5000)
+    def __init__(self, char, iterations=5000):
+        super().__init__(iterations)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
+
+
+class BoardMasks:
+    """ Cell bitmasks of a board, the bit of (row, col) is row * cols + col """
+
+    def __init__(self, rows, cols, radius):
+        self.cells = [(row, col) for row in range(rows) for col in range(cols)]
+        # The cells in the square of the radius around each cell (itself included)
+        self.neighbours = []
+        for row, col in self.cells:
+            mask = 0
+            for near_row in range(max(row - radius, 0), min(row + radius + 1, rows)):
+                for near_col in range(max(col - radius, 0), min(col + radius + 1, cols)):
+                    mask |= 1 << (near_row * cols + near_col)
+            self.neighbours.append(mask)
+
+    def iter_cells(self, mask):
+        while mask:
+            lowest = mask & -mask
+            yield self.cells[lowest.bit_length() - 1]
+            mask ^= lowest
+
+
+@functools.lru_cache(maxsize=None)
+def get_board_masks(rows, cols, radius) -> BoardMasks:
+    return BoardMasks(rows, cols, radius)
+
+
+def _pattern_scores(size, score_func):
+    """ A table of score_func for every window of size cells, indexed by: own stones | blocked cells << size """
+    scores = [0] * (1 << 2 * size)
+    for own in range(1 << size):
+        for blocked in range(1 << size):
+            if not own & blocked:
+                cells = ''.join('X' if own >> i & 1 else 'B' if blocked >> i & 1 else '_' for i in range(size))
+                scores[own | blocked << size] = score_func(cells)
+
+    return scores
+
+
+def _window_score(cells):
+    return 0 if 'B' in cells else WINDOW_SCORES[cells.count('X')]
+
+
+def _open_window_score(cells):
+    if cells == '_XXXX_':
+        return OPEN_FOUR_SCORE
+    if cells in ('_XXX__', '__XXX_', '_XX_X_', '_X_XX_'):
+        return OPEN_THREE_SCORE
+    if cells in ('__XX__', '_XX___', '___XX_', '_X_X__', '__X_X_'):
+        return OPEN_TWO_SCORE
+    return 0
+
+
+WINDOW_PATTERN_SCORES = _pattern_scores(AMOUNT_IN_A_ROW, _window_score)
+OPEN_PATTERN_SCORES = _pattern_scores(AMOUNT_IN_A_ROW + 1, _open_window_score)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def line_score(length, own, blocked):
+    """ The threat score of a line for the owner of the own stones, blocked are the other player's stones """
+    # Surround the line with blocked cells, so the board edges block like stones
+    blocked = blocked << 1 | 1 | 1 << (length + 1)
+    own <<= 1
+    score = 0
+    for i in range(length - AMOUNT_IN_A_ROW + 3):
+        score += WINDOW_PATTERN_SCORES[(own >> i) & 0b11111 | ((blocked >> i) & 0b11111) << 5]
+        if i < length - AMOUNT_IN_A_ROW + 2:
+            score += OPEN_PATTERN_SCORES[(own >> i) & 0b111111 | ((blocked >> i) & 0b111111) << 6]
+
+    return score
+
+
+class BoardLines:
+    """ The rows, columns and diagonals long enough for a five, and the lines (and positions in them) of each cell """
+
+    def __init__(self, rows, cols):
+        self.lines = []
+        starts = [(0, 1, [(row, 0) for row in range(rows)]),
+                  (1, 0, [(0, col) for col in range(cols)]),
+                  (1, 1, [(row, 0) for row in range(rows - 1, 0, -1)] + [(0, col) for col in range(cols)]),
+                  (1, -1, [(0, col) for col in range(cols)] + [(row, cols - 1) for row in range(1, rows)])]
+        for row_dir, col_dir, line_starts in starts:
+            for row, col in line_starts:
+                line = []
+                while 0 <= row < rows and 0 <= col < cols:
+                    line.append(row * cols + col)
+                    row, col = row + row_dir, col + col_dir
+                if len(line) >= AMOUNT_IN_A_ROW:
+                    self.lines.append(line)
+
+        self.lengths = [len(line) for line in self.lines]
+        self.cell_lines = [[] for _ in range(rows * cols)]
+        for line_index, line in enumerate(self.lines):
+            for position, cell in enumerate(line):
+                self.cell_lines[cell].append((line_index, position))
+
+
+@functools.lru_cache(maxsize=None)
+def get_board_lines(rows, cols) -> BoardLines:
+    return BoardLines(rows, cols)
+
+
+class LineEval:
+    """
+    The stones of every line as an integer key: the AI stones in the low bits, the other stones shifted by the
+    line length, together with the score (for the AI) of each line and their total
+    """
+
+    def __init__(self, keys, scores, total):
+        self.keys = keys
+        self.scores = scores
+        self.total = total
+
+    @staticmethod
+    def score(length, key):
+        ai_stones, other_stones = key & ((1 << length) - 1), key >> length
+        return line_score(length, ai_stones, other_stones) - line_score(length, other_stones, ai_stones)
+
+
+class FiveInRowMinimaxPlayer(minimax.MinimaxPlayer):
+    def __init__(self, char, depth=2):
+        super().__init__(depth)
         self.m_char = char
 
     def get_char(self):
@@ -52,32 +196,45 @@ class FiveInRowAiPlayer(CarloMontePlayer):  # minimax.MinimaxPlayer):
 
 
 class FiveInRowState(game.GameState):
-    def __init__(self, cells, players, prev_moves=None, last_move=None, player_index=0):
+    EVAL_CHAR = AI_CHAR
+
+    def __init__(self, cells, players, candidates=None, occupied=None, last_move=None, player_index=0,
+                 radius=RADIUS):
         super().__init__(players, player_index)
         self.last_move = last_move
         self.cells = cells
         self.rows = len(self.cells)
         self.cols = len(self.cells[0])
+        self.radius = radius
+        self.masks = get_board_masks(self.rows, self.cols, radius)
 
-        self.moves = prev_moves[::] if prev_moves is not None else [(self.rows // 2, self.cols // 2)]
-        # sort by distance to the middle
-        # self.moves.sort(key=lambda move: abs(move[0] - self.rows / 2) + abs(move[1] - self.cols / 2))
-        if last_move:
-            _last_player, last_move_cell = last_move
-            try:
-                self.moves.remove(last_move_cell)
-            except ValueError:
-                # Its not in the list
-                pass
+        # The candidate moves are the empty cells near a stone, as a bitmask that move() updates
+        if candidates is None:
+            occupied = 0
+            for index, (row, col) in enumerate(self.masks.cells):
+                if self.cells[row][col] != ' ':
+                    occupied |= 1 << index
+
+            candidates = 0
+            for index in range(self.rows * self.cols):
+                if occupied >> index & 1:
+                    candidates |= self.masks.neighbours[index]
+            candidates &= ~occupied
 
-            self.moves = [move for move in self.moves_in_radius(last_move_cell[0], last_move_cell[1], 1)
-                          if move not in self.moves] + self.moves
+            if not occupied:
+                candidates = 1 << ((self.rows // 2) * self.cols + self.cols // 2)
 
-            assert len(self.moves) == len(set(self.moves))
+        self.candidates = candidates
+        self.occupied = occupied
 
-    def notify_move(self):
-        print(f'Player {self.last_move[0].get_char()} '
-              f'played at cell ({self.last_move[1][0] + 1}, {ascii_uppercase[self.last_move[1][1]]}).')
+        # The lines evaluation is computed on demand from the closest evaluated ancestor
+        self.lines = get_board_lines(self.rows, self.cols)
+        self.line_eval = None
+        self.eval_parent = None
+
+    def describe_move(self):
+        return f'Player {self.last_move[0].get_char()} ' \
+               f'played at cell ({self.last_move[1][0] + 1}, {ascii_uppercase[self.last_move[1][1]]}).'
 
     def in_board(self, row, col):
         return 0 <= row < self.rows and 0 <= col < self.cols
@@ -166,17 +323,76 @@ class FiveInRowState(game.GameState):
     def eval(self):
         winner = self.get_winner()
 
-        score = 0
+        # Keep the threats below the score of a win
+        score = max(-minimax.INF // 2, min(self.get_line_eval().total, minimax.INF // 2))
         if winner is not None:
             score += minimax.INF if winner.get_char() == AI_CHAR else -minimax.INF
 
-        score += self.eval_direction(0, 1, self.rows, self.cols - AMOUNT_IN_A_ROW + 1)
-        score += self.eval_direction(1, 0, self.rows - AMOUNT_IN_A_ROW + 1, self.cols)
-        score += self.eval_direction(1, 1, self.rows - AMOUNT_IN_A_ROW + 1, self.cols - AMOUNT_IN_A_ROW + 1)
-        score += self.eval_direction(1, -1, self.cols - AMOUNT_IN_A_ROW + 1, self.cols, cols_start=AMOUNT_IN_A_ROW - 1)
-
         return score
 
+    def _eval_all_lines(self):
+        keys = []
+        for line, length in zip(self.lines.lines, self.lines.lengths):
+            key = 0
+            for position, cell in enumerate(line):
+                char = self.cells[cell // self.cols][cell % self.cols]
+                if char != ' ':
+                    key |= 1 << (position if char == AI_CHAR else position + length)
+            keys.append(key)
+
+        scores = [LineEval.score(length, key) for length, key in zip(self.lines.lengths, keys)]
+        return LineEval(keys, scores, sum(scores))
+
+    def _eval_lines_of_last_move(self, parent_eval: LineEval):
+        """ Update only the lines that pass through the last move """
+        keys = parent_eval.keys[::]
+        scores = parent_eval.scores[::]
+        total = parent_eval.total
+
+        (row, col), is_ai = self.last_move[1], self.last_move[0].get_char() == AI_CHAR
+        for line_index, position in self.lines.cell_lines[row * self.cols + col]:
+            length = self.lines.lengths[line_index]
+            keys[line_index] |= 1 << (position if is_ai else position + length)
+            new_score = LineEval.score(length, keys[line_index])
+            total += new_score - scores[line_index]
+            scores[line_index] = new_score
+
+        return LineEval(keys, scores, total)
+
+    def get_line_eval(self) -> LineEval:
+        if self.line_eval is None:
+            chain = []
+            state = self
+            while state.line_eval is None and state.eval_parent is not None:
+                chain.append(state)
+                state = state.eval_parent
+
+            if state.line_eval is None:
+                state.line_eval = state._eval_all_lines()
+
+            for state in reversed(chain):
+                state.line_eval = state._eval_lines_of_last_move(state.eval_parent.line_eval)
+                state.eval_parent = None
+
+        return self.line_eval
+
+    def move_threat(self, move):
+        """ How much the move improves the lines of the current player, plus how much it would improve the other's """
+        line_eval = self.get_line_eval()
+        row, col = move
+        threat = 0
+        for line_index, position in self.lines.cell_lines[row * self.cols + col]:
+            length, key = self.lines.lengths[line_index], line_eval.keys[line_index]
+            ai_gain = LineEval.score(length, key | 1 << position) - line_eval.scores[line_index]
+            other_gain = line_eval.scores[line_index] - LineEval.score(length, key | 1 << (position + length))
+            threat += ai_gain + other_gain
+
+        return threat
+
+    def order_moves(self, moves):
+        # Both players gain from a move threatening (or blocking) threats, the current player should look at them first
+        return sorted(moves, key=self.move_threat, reverse=True)
+
     def moves_in_radius(self, row, col, radius):
         for i in range(-radius, radius + 1):
             if self.in_board(row + i, 0):
@@ -186,6 +402,43 @@ class FiveInRowState(game.GameState):
                         # print(f'Generated {row + i}, {col + j} from {row}, {col} - r = {radius}')
                         yield (row + i, col + j)
 
+    @property
+    def moves(self):
+        """ The candidate moves, the ones around the last move first """
+        if self.m_moves is None:
+            near_last_move = 0
+            if self.last_move:
+                row, col = self.last_move[1]
+                near_last_move = self.masks.neighbours[row * self.cols + col] & self.candidates
+
+            self.m_moves = list(self.masks.iter_cells(near_last_move)) + \
+                list(self.masks.iter_cells(self.candidates & ~near_last_move))
+
+        return self.m_moves
+
+    def _canonical(self):
+        """ The smallest form of the stones as seen through the symmetries, and that symmetry """
+        codes = self._char_codes()
+        stones = [[] for _ in self.m_players]
+        for row, col in self.masks.iter_cells(self.occupied):
+            stones[codes[self.cells[row][col]] - 1].append(row * self.cols + col)
+
+        symmetries = game.board_symmetries(self.rows, self.cols)
+        form, index = min((tuple(symmetry.map_cells(player_stones) for player_stones in stones), index)
+                          for index, symmetry in enumerate(symmetries))
+        return form, symmetries[index]
+
+    def canonical_key(self):
+        return self._canonical()[0], self.m_curr_player_index
+
+    def canonical_move(self, move):
+        row, col = move
+        return divmod(self._canonical()[1].cell_map[row * self.cols + col], self.cols)
+
+    def from_canonical_move(self, move):
+        row, col = move
+        return divmod(self._canonical()[1].source[row * self.cols + col], self.cols)
+
     def get_moves(self):
         return iter(self.moves)
 
@@ -210,46 +463,67 @@ class FiveInRowState(game.GameState):
                          enumerate(self.cells)]  # copy only the row that is about to change
             new_cells[row][col] = self.get_curr_player().get_char()
             last_move = (self.get_curr_player(), move)
-            return FiveInRowState(cells=new_cells,
-                                  players=self.m_players,
-                                  prev_moves=self.moves,  # create a copy of the moves
-                                  last_move=last_move,
-                                  player_index=self._next_player_index())
+            index = row * self.cols + col
+            occupied = self.occupied | 1 << index
+            new_state = FiveInRowState(cells=new_cells,
+                                       players=self.m_players,
+                                       candidates=(self.candidates | self.masks.neighbours[index]) & ~occupied,
+                                       occupied=occupied,
+                                       last_move=last_move,
+                                       player_index=self._next_player_index(),
+                                       radius=self.radius)
+            new_state.eval_parent = self
+            return new_state
 
         assert True, 'wtf'
 
+    def to_bytes(self):
+        last_cell = self.last_move[1][0] * self.cols + self.last_move[1][1] if self.last_move else NO_LAST_MOVE
+        codes = self._char_codes()
+        return BYTES_HEADER.pack(self.rows, self.cols, self.radius, self.m_curr_player_index, last_cell) + \
+            game.pack_2bit(codes[cell] for row in self.cells for cell in row)
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        rows, cols, radius, player_index, last_cell = BYTES_HEADER.unpack_from(data)
+        chars = cls._code_chars(players)
+        flat = [chars[code] for code in game.unpack_2bit(data[BYTES_HEADER.size:], rows * cols)]
+        cells = [flat[row * cols:(row + 1) * cols] for row in range(rows)]
+
+        last_move = (players[(player_index - 1) % len(players)], divmod(last_cell, cols)) \
+            if last_cell != NO_LAST_MOVE else None
+        return FiveInRowState(cells, players, last_move=last_move, player_index=player_index, radius=radius)
+
     def __eq__(self, other) -> bool:
         return super().__eq__(other) and self.cells == other.cells
 
     def __str__(self):
-        ret = ' ' * 2 + '   '.join(ascii_uppercase[:COLS]) + '\n'
+        ret = ' ' * 3 + '   '.join(ascii_uppercase[:self.cols]) + '\n'
         for row_index, row in enumerate(self.cells):
-            ret += f'{row_index + 1} '
+            ret += f'{row_index + 1:2} '
             for col_index, cell in enumerate(row):
                 ret += cell if cell != ' ' else ' '  # str(i + 1)
                 if col_index < self.cols - 1:
                     ret += ' | '
 
             if row_index < self.rows - 1:
-                ret += f'\n {"-" * (self.cols * 4 - 1)}\n'
+                ret += f'\n  {"-" * (self.cols * 4 - 1)}\n'
 
         return ret + '\n'
 
 
+def new_game(players, observers=(), rows=ROWS, cols=COLS, radius=RADIUS):
+    board = [[' ' for _ in range(cols)] for _ in range(rows)]
+    return game.Game(FiveInRowState(board, players, radius=radius), observers)
+
+
 def main():
-    board = [[' ' for _ in range(COLS)] for _ in range(ROWS)]
     human_player = FiveInRowHumanPlayer(HUMAN_CHAR)
     ai_player = FiveInRowAiPlayer(AI_CHAR)
-    five_in_row_game = game.Game(FiveInRowState(board, [human_player, ai_player]))
-
-    for state in five_in_row_game.play():
-        print(state)
+    five_in_row_game = new_game([human_player, ai_player], observers=[game.ConsoleObserver()])
 
-    winner = five_in_row_game.get_winner()
-    if winner is not None:
-        print(f'The winner is {winner.get_char()}!')
-    else:
-        print(f'It\'s a tie!')
+    for _state in five_in_row_game.play():
+        pass
 
 
 if __name__ == '__main__':
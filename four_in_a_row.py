@@ -1,3 +1,5 @@
+import functools
+
 import game
 import minimax
 from carlo_monte import CarloMontePlayer
@@ -36,8 +38,8 @@ class FourInRowHumanPlayer(game.Player):
 
 
 class FourInRowAiPlayer(CarloMontePlayer):
-    def __init__(self, char):
-        super().__init__(5000)
+    def __init__(self, char, iterations=5000):
+        super().__init__(iterations)
         self.m_char = char
 
     def get_char(self):
@@ -47,8 +49,66 @@ class FourInRowAiPlayer(CarloMontePlayer):
         return f'PLAYER_{self.m_char}'
 
 
+class FourInRowMinimaxPlayer(minimax.MinimaxPlayer):
+    def __init__(self, char, depth=4):
+        super().__init__(depth)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
+
+
+class EvalWindows:
+    """
+    All the windows of AMOUNT_IN_A_ROW cells that eval scores, and the windows each cell is part of.
+    A window is scored by its first cell: nothing if it is empty, otherwise for the player in it,
+    5 ** (the player's stones in the window), or just 1 if the other player has stones in the window too.
+    """
+
+    def __init__(self, rows, cols):
+        self.windows = []
+        for row_dir, col_dir, rows_range, cols_range in (
+                (0, 1, range(rows), range(cols - AMOUNT_IN_A_ROW + 1)),
+                (1, 0, range(rows - AMOUNT_IN_A_ROW + 1), range(cols)),
+                (1, 1, range(rows - AMOUNT_IN_A_ROW + 1), range(cols - AMOUNT_IN_A_ROW + 1)),
+                (1, -1, range(rows - AMOUNT_IN_A_ROW + 1), range(AMOUNT_IN_A_ROW - 1, cols))):
+            for row in rows_range:
+                for col in cols_range:
+                    self.windows.append([(row + row_dir * i, col + col_dir * i) for i in range(AMOUNT_IN_A_ROW)])
+
+        self.cell_windows = [[[] for _ in range(cols)] for _ in range(rows)]
+        for index, window in enumerate(self.windows):
+            for row, col in window:
+                self.cell_windows[row][col].append(index)
+
+        # The counts of a window are packed as: AI stones | other stones << WINDOW_COUNT_BITS
+        self.values = {}
+        for ai_count in range(AMOUNT_IN_A_ROW + 1):
+            for other_count in range(AMOUNT_IN_A_ROW + 1):
+                counts = ai_count | other_count << WINDOW_COUNT_BITS
+                blocked = ai_count and other_count
+                self.values[AI_CHAR, counts] = 1 if blocked else 5 ** ai_count
+                self.values[HUMAN_CHAR, counts] = -1 if blocked else -5 ** other_count
+                self.values[' ', counts] = 0
+
+
+WINDOW_COUNT_BITS = 3
+NOT_COMPUTED = game.NOT_COMPUTED
+
+
+@functools.lru_cache(maxsize=None)
+def get_eval_windows(rows, cols) -> EvalWindows:
+    return EvalWindows(rows, cols)
+
+
 class FourInRowState(game.GameState):
-    def __init__(self, cells, players, amount_per_col=None, last_move=None, player_index=0):
+    EVAL_CHAR = AI_CHAR
+
+    def __init__(self, cells, players, amount_per_col=None, last_move=None, player_index=0,
+                 window_counts=None, window_score=None, winner=NOT_COMPUTED):
         super().__init__(players, player_index)
         self.last_move = last_move
         self.cells = cells
@@ -56,8 +116,33 @@ class FourInRowState(game.GameState):
         self.cols = len(self.cells[0])
         self.amount_per_col = amount_per_col if amount_per_col else [0] * self.cols
 
-    def notify_move(self):
-        print(f'Player {self.last_move[0].get_char()} played at column {self.last_move[1] + 1}.')
+        self.eval_windows = get_eval_windows(self.rows, self.cols)
+        if window_counts is None:
+            window_counts, window_score = self._count_windows()
+        self.window_counts = window_counts
+        self.window_score = window_score
+        self.winner = winner
+
+    def _count_windows(self):
+        window_counts = []
+        window_score = 0
+        for window in self.eval_windows.windows:
+            chars = [self.cells[row][col] for row, col in window]
+            ai_count = chars.count(AI_CHAR)
+            counts = ai_count | (AMOUNT_IN_A_ROW - chars.count(' ') - ai_count) << WINDOW_COUNT_BITS
+            window_counts.append(counts)
+            window_score += self._window_value(chars[0], counts)
+
+        return window_counts, window_score
+
+    def _window_value(self, first_char, counts):
+        if first_char != ' ' and first_char != AI_CHAR:
+            first_char = HUMAN_CHAR  # Any other player
+
+        return self.eval_windows.values[first_char, counts]
+
+    def describe_move(self):
+        return f'Player {self.last_move[0].get_char()} played at column {self.last_move[1] + 1}.'
 
     def in_board(self, row, col):
         return 0 <= row < self.rows and 0 <= col < self.cols
@@ -86,6 +171,12 @@ class FourInRowState(game.GameState):
         return counter
 
     def get_winner(self):
+        if self.winner is NOT_COMPUTED:
+            self.winner = self._find_winner()
+
+        return self.winner
+
+    def _find_winner(self):
         if self.last_move:
             last_player = self.last_move[0]
             col = self.last_move[1]
@@ -116,17 +207,31 @@ class FourInRowState(game.GameState):
     def eval(self):
         winner = self.get_winner()
 
-        score = 0
+        score = self.window_score  # Kept up to date by move(), the same as summing eval_direction on all directions
         if winner is not None:
             score += minimax.INF if winner.get_char() == AI_CHAR else -minimax.INF
 
-        score += self.eval_direction(0, 1, self.rows, self.cols - AMOUNT_IN_A_ROW + 1)
-        score += self.eval_direction(1, 0, self.rows - AMOUNT_IN_A_ROW + 1, self.cols)
-        score += self.eval_direction(1, 1, self.rows - AMOUNT_IN_A_ROW + 1, self.cols - AMOUNT_IN_A_ROW + 1)
-        score += self.eval_direction(1, -1, self.cols - AMOUNT_IN_A_ROW + 1, self.cols, cols_start=AMOUNT_IN_A_ROW - 1)
-
         return score
 
+    def _symmetric_forms(self):
+        """ The board as is and mirrored left to right, gravity rules out its other symmetries """
+        codes = self._char_codes()
+        return (tuple(codes[cell] for row in self.cells for cell in row),
+                tuple(codes[cell] for row in self.cells for cell in reversed(row)))
+
+    def _is_mirrored(self):
+        straight, mirrored = self._symmetric_forms()
+        return mirrored < straight
+
+    def canonical_key(self):
+        return min(self._symmetric_forms()), self.m_curr_player_index
+
+    def canonical_move(self, move):
+        return self.cols - 1 - move if self._is_mirrored() else move
+
+    def from_canonical_move(self, move):
+        return self.canonical_move(move)  # The mirror is its own inverse
+
     def get_moves(self):
         return (i for i, amount in enumerate(self.amount_per_col) if amount < self.rows)
 
@@ -136,15 +241,54 @@ class FourInRowState(game.GameState):
             row = self.amount_per_col[col]
             new_cells = [r if index != row else r[::] for index, r in
                          enumerate(self.cells)]  # copy only the row that is about to change
-            new_cells[row][col] = self.get_curr_player().get_char()
+            char = self.get_curr_player().get_char()
+            new_cells[row][col] = char
             new_amount_per_col = self.amount_per_col[::]
             new_amount_per_col[col] += 1
             last_move = (self.get_curr_player(), move)
+
+            # Update only the windows of the new stone
+            is_ai = char == AI_CHAR
+            window_counts = self.window_counts[::]
+            window_score = self.window_score
+            winner = None
+            for index in self.eval_windows.cell_windows[row][col]:
+                first_row, first_col = self.eval_windows.windows[index][0]
+                counts = window_counts[index]
+                window_score -= self._window_value(self.cells[first_row][first_col], counts)
+                counts += 1 if is_ai else 1 << WINDOW_COUNT_BITS
+                window_score += self._window_value(new_cells[first_row][first_col], counts)
+                window_counts[index] = counts
+
+                if (counts & ((1 << WINDOW_COUNT_BITS) - 1) if is_ai else counts >> WINDOW_COUNT_BITS) == \
+                        AMOUNT_IN_A_ROW:
+                    winner = self.get_curr_player()
+
             return FourInRowState(cells=new_cells,
                                   players=self.m_players,
                                   amount_per_col=new_amount_per_col,
                                   last_move=last_move,
-                                  player_index=self._next_player_index())
+                                  player_index=self._next_player_index(),
+                                  window_counts=window_counts,
+                                  window_score=window_score,
+                                  winner=winner)
+
+    def to_bytes(self):
+        # Header: player index (2 bits) and the last move column + 1, then 2 bits per cell (row by row)
+        last_col = self.last_move[1] + 1 if self.last_move else 0
+        codes = self._char_codes()
+        return bytes([self.rows, self.cols, self.m_curr_player_index | last_col << 2]) + \
+            game.pack_2bit(codes[cell] for row in self.cells for cell in row)
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        rows, cols, player_index, last_col = data[0], data[1], data[2] & 0b11, data[2] >> 2
+        chars = cls._code_chars(players)
+        flat = [chars[code] for code in game.unpack_2bit(data[3:], rows * cols)]
+        cells = [flat[row * cols:(row + 1) * cols] for row in range(rows)]
+        amount_per_col = [sum(cells[row][col] != ' ' for row in range(rows)) for col in range(cols)]
+        last_move = (players[(player_index - 1) % len(players)], last_col - 1) if last_col else None
+        return FourInRowState(cells, players, amount_per_col, last_move, player_index)
 
     def __eq__(self, other) -> bool:
         return super().__eq__(other) and self.cells == other.cells
@@ -165,20 +309,178 @@ class FourInRowState(game.GameState):
         return ret + '\n'
 
 
-def main():
+class BitboardGeometry:
+    """
+    Precomputed masks of a bitboard: column col takes the bits col * (rows + 1) to col * (rows + 1) + rows - 1,
+    from the bottom row up, and the extra bit at the top of each column stays empty so shifts never wrap around.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.col_height = rows + 1
+        self.bottom = [1 << (col * self.col_height) for col in range(cols)]
+        self.top = [1 << (col * self.col_height + rows - 1) for col in range(cols)]
+        self.column = [((1 << rows) - 1) << (col * self.col_height) for col in range(cols)]
+        # Shifts between neighbouring cells in the directions: vertical, horizontal and the two diagonals
+        self.shifts = (1, self.col_height, self.col_height + 1, self.col_height - 1)
+
+        # The same windows FourInRowState.eval scores, as (first cell bit, window mask)
+        self.windows = [(self.bit(*window[0]), sum(self.bit(row, col) for row, col in window))
+                        for window in get_eval_windows(rows, cols).windows]
+
+    def bit(self, row, col):
+        return 1 << (col * self.col_height + row)
+
+    def has_four(self, board):
+        for shift in self.shifts:
+            pairs = board & (board >> shift)
+            if pairs & (pairs >> 2 * shift):
+                return True
+
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def get_bitboard_geometry(rows, cols) -> BitboardGeometry:
+    assert AMOUNT_IN_A_ROW == 4, 'The bitboard win detection looks for 4 in a row'
+    return BitboardGeometry(rows, cols)
+
+
+class FourInRowBitState(FourInRowState):
+    """
+    FourInRowState kept as a bitboard per player (indexed like the players) and a bitboard of all the stones.
+    Moves are applied in O(1) and the winner is found with shifts when the move is made.
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, players, boards=None, last_move=None, player_index=0, rows=ROWS, cols=COLS, winner=None):
+        game.GameState.__init__(self, players, player_index)
+        self.geometry = get_bitboard_geometry(rows, cols)
+        self.rows = rows
+        self.cols = cols
+        self.boards = boards if boards else (0,) * len(players)
+        self.mask = functools.reduce(int.__or__, self.boards)
+        self.last_move = last_move
+        self.winner = winner
+
+    @staticmethod
+    def from_state(state: FourInRowState) -> 'FourInRowBitState':
+        geometry = get_bitboard_geometry(state.rows, state.cols)
+        chars = [player.get_char() for player in state.m_players]
+        boards = [0] * len(chars)
+        for row in range(state.rows):
+            for col in range(state.cols):
+                if state.cells[row][col] != ' ':
+                    boards[chars.index(state.cells[row][col])] |= geometry.bit(row, col)
+
+        return FourInRowBitState(state.m_players, tuple(boards), state.last_move, state.m_curr_player_index,
+                                 state.rows, state.cols, state.get_winner())
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        return cls.from_state(FourInRowState.from_bytes(data, players))
+
+    @property
+    def cells(self):
+        chars = [player.get_char() for player in self.m_players]
+        return [[next((char for char, board in zip(chars, self.boards) if board & self.geometry.bit(row, col)), ' ')
+                 for col in range(self.cols)]
+                for row in range(self.rows)]
+
+    @property
+    def amount_per_col(self):
+        return [bin(self.mask & column).count('1') for column in self.geometry.column]
+
+    def get_winner(self):
+        return self.winner
+
+    def eval(self):
+        ai_index = next((i for i, player in enumerate(self.m_players) if player.get_char() == AI_CHAR), None)
+
+        score = 0
+        if self.winner is not None:
+            score += minimax.INF if self.winner.get_char() == AI_CHAR else -minimax.INF
+
+        for first_bit, window in self.geometry.windows:
+            if first_bit & self.mask:
+                for index, board in enumerate(self.boards):
+                    if first_bit & board:
+                        break
+
+                if window & (self.mask ^ board):
+                    curr_score = 1
+                else:
+                    curr_score = 5 ** bin(window & board).count('1')
+                score += curr_score if index == ai_index else -curr_score
+
+        return score
+
+    def _symmetric_forms(self):
+        geometry = self.geometry
+        mirrored_boards = []
+        for board in self.boards:
+            mirrored = 0
+            for col, column in enumerate(geometry.column):
+                mirrored |= ((board & column) >> (col * geometry.col_height)) << \
+                    ((self.cols - 1 - col) * geometry.col_height)
+            mirrored_boards.append(mirrored)
+
+        return self.boards, tuple(mirrored_boards)
+
+    def get_moves(self):
+        return (col for col, top in enumerate(self.geometry.top) if not self.mask & top)
+
+    def get_winning_move(self):
+        board = self.boards[self.m_curr_player_index]
+        for col, top in enumerate(self.geometry.top):
+            if not self.mask & top:
+                new_stone = (self.mask + self.geometry.bottom[col]) & self.geometry.column[col]
+                if self.geometry.has_four(board | new_stone):
+                    return col
+
+        return None
+
+    def move(self, move: int):
+        if 0 <= move < self.cols and not self.mask & self.geometry.top[move]:
+            new_stone = (self.mask + self.geometry.bottom[move]) & self.geometry.column[move]
+            index = self.m_curr_player_index
+            board = self.boards[index] | new_stone
+
+            # Skip the constructor, everything is already known
+            new_state = object.__new__(FourInRowBitState)
+            new_state.m_players = self.m_players
+            new_state.m_curr_player_index = self._next_player_index()
+            new_state.m_moves = None
+            new_state.geometry = self.geometry
+            new_state.rows = self.rows
+            new_state.cols = self.cols
+            new_state.boards = self.boards[:index] + (board,) + self.boards[index + 1:]
+            new_state.mask = self.mask | new_stone
+            new_state.last_move = (self.get_curr_player(), move)
+            new_state.winner = self.get_curr_player() if self.geometry.has_four(board) else None
+            return new_state
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, FourInRowBitState):
+            return FourInRowState.__eq__(self, other)
+
+        return game.GameState.__eq__(self, other) and self.boards == other.boards
+
+
+def new_game(players, observers=(), bitboard=False):
     board = [[' ' for _ in range(COLS)] for _ in range(ROWS)]
+    state = FourInRowState(board, players)
+    return game.Game(FourInRowBitState.from_state(state) if bitboard else state, observers)
+
+
+def main():
     human_player = FourInRowHumanPlayer(HUMAN_CHAR)
     ai_player = FourInRowAiPlayer(AI_CHAR)
-    five_in_row_game = game.Game(FourInRowState(board, [human_player, ai_player]))
-
-    for state in five_in_row_game.play():
-        print(state)
+    five_in_row_game = new_game([human_player, ai_player], observers=[game.ConsoleObserver()])
 
-    winner = five_in_row_game.get_winner()
-    if winner is not None:
-        print(f'The winner is {winner.get_char()}!')
-    else:
-        print(f'It\'s a tie!')
+    for _state in five_in_row_game.play():
+        pass
 
 
 if __name__ == '__main__':
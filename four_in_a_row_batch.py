@@ -0,0 +1,217 @@
+"""
+Four in a row random playouts run in lockstep with NumPy, thousands per call.
+
+The games are a game.BatchGameState of 64 bit bitboards like FourInRowBitState: every step plays a random legal
+column in all the unfinished games at once, checks them all for a four with shifts, and drops the finished ones.
+A batched rollout scores an MCTS leaf with the average result of all its playouts, on the same scale as
+CarloMonteTreeNode.simulate().
+
+Needs numpy.
+"""
+import functools
+import random
+
+import numpy as np
+
+import game
+from carlo_monte import CarloMontePlayer, TIE_SCORE
+from four_in_a_row import FourInRowBitState, get_bitboard_geometry
+
+PLAYOUTS = 256
+
+
+@functools.lru_cache(maxsize=None)
+def _get_numpy_geometry(rows, cols):
+    """ The bottom, top and column masks of the bitboards as arrays, the top of all the columns, and the shifts """
+    geometry = get_bitboard_geometry(rows, cols)
+    return (np.array(geometry.bottom, dtype=np.uint64),
+            np.array(geometry.top, dtype=np.uint64),
+            np.array(geometry.column, dtype=np.uint64),
+            np.uint64(sum(geometry.top)),
+            [(np.uint64(shift), np.uint64(2 * shift)) for shift in geometry.shifts])
+
+
+def _has_four(boards, shifts):
+    won = np.zeros(len(boards), dtype=bool)
+    for shift, double_shift in shifts:
+        pairs = boards & (boards >> shift)
+        won |= (pairs & (pairs >> double_shift)) != 0
+
+    return won
+
+
+class FourInRowBatchState(game.BatchGameState):
+    """ Four in a row games in a batch, a 64 bit bitboard per player in each game like FourInRowBitState """
+
+    def __init__(self, rows, cols, boards, player_indexes, winners):
+        """ boards - a (games, 2) uint64 array of the bitboards of each player """
+        self.rows = rows
+        self.cols = cols
+        self.move_count = cols
+        self.boards = boards
+        self.mask = boards[:, 0] | boards[:, 1]
+        self.player_indexes = player_indexes
+        self.winner_indexes = winners
+        self.ply_counts = np.zeros(len(boards), dtype=np.int32)
+
+    @classmethod
+    def from_states(cls, states):
+        assert len(states[0].m_players) == 2, 'The batch is of two players games'
+        states = [state if isinstance(state, FourInRowBitState) else FourInRowBitState.from_state(state)
+                  for state in states]
+        return cls(states[0].rows, states[0].cols,
+                   np.array([state.boards for state in states], dtype=np.uint64),
+                   np.array([state.m_curr_player_index for state in states], dtype=np.int8),
+                   np.array([-1 if state.winner is None else state.m_players.index(state.winner) for state in states],
+                            dtype=np.int8))
+
+    @classmethod
+    def from_state(cls, state, count):
+        return cls.from_states([state]).take(np.zeros(count, dtype=np.intp))
+
+    def take(self, indexes) -> 'FourInRowBatchState':
+        """ A new batch of the games at the indexes, which may repeat """
+        batch = FourInRowBatchState(self.rows, self.cols, self.boards[indexes], self.player_indexes[indexes],
+                                    self.winner_indexes[indexes])
+        batch.ply_counts = self.ply_counts[indexes]
+        return batch
+
+    def __len__(self):
+        return len(self.boards)
+
+    def current_players(self):
+        return self.player_indexes
+
+    def legal_moves(self):
+        _bottom, top, _column, _all_tops, _shifts = _get_numpy_geometry(self.rows, self.cols)
+        return ((self.mask[:, None] & top) == 0) & ~self.terminal()[:, None]
+
+    def apply_moves(self, moves):
+        bottom, _top, column, _all_tops, shifts = _get_numpy_geometry(self.rows, self.cols)
+        games = np.flatnonzero(~self.terminal())
+        cols = np.asarray(moves)[games]
+        players = self.player_indexes[games]
+
+        new_stones = (self.mask[games] + bottom[cols]) & column[cols]
+        self.mask[games] |= new_stones
+        boards = self.boards[games, players] | new_stones
+        self.boards[games, players] = boards
+
+        self.winner_indexes[games] = np.where(_has_four(boards, shifts), players, -1)
+        self.player_indexes[games] = 1 - players
+        self.ply_counts[games] += 1
+
+    def winners(self):
+        return self.winner_indexes
+
+    def terminal(self):
+        all_tops = _get_numpy_geometry(self.rows, self.cols)[3]
+        return (self.winner_indexes >= 0) | ((self.mask & all_tops) == all_tops)
+
+    def plies(self):
+        return self.ply_counts
+
+    def get_state(self, index, players):
+        winner_index = self.winner_indexes[index]
+        return FourInRowBitState(players, tuple(int(board) for board in self.boards[index]),
+                                 player_index=int(self.player_indexes[index]), rows=self.rows, cols=self.cols,
+                                 winner=players[winner_index] if winner_index >= 0 else None)
+
+    def play_random(self, rng):
+        """ Like BatchGameState.play_random(), but each step only works on the games that are still playing """
+        bottom, top, column, all_tops, shifts = _get_numpy_geometry(self.rows, self.cols)
+
+        # The unfinished games: their indexes into the batch, and copies of their arrays that are played.
+        # The boards are kept as the board of the player to move and the other one, which swap after every move.
+        games = np.flatnonzero(~self.terminal())
+        mask, players, ply_counts = self.mask[games], self.player_indexes[games], self.ply_counts[games]
+        first = players == 0
+        to_move = np.where(first, self.boards[games, 0], self.boards[games, 1])
+        waiting = np.where(first, self.boards[games, 1], self.boards[games, 0])
+        while len(games):
+            # A uniformly random legal column: the largest of random keys, where the illegal columns get -1
+            legal = (mask[:, None] & top) == 0
+            cols = np.where(legal, rng.random(legal.shape), -1).argmax(axis=1)
+            new_stones = (mask + bottom[cols]) & column[cols]
+            mask |= new_stones
+            moved = to_move | new_stones
+            won = _has_four(moved, shifts)
+            ply_counts += 1
+
+            done = won | ((mask & all_tops) == all_tops)
+            if done.any():
+                finished, finished_players = games[done], players[done]
+                self.boards[finished, finished_players] = moved[done]
+                self.boards[finished, 1 - finished_players] = waiting[done]
+                self.mask[finished] = mask[done]
+                self.player_indexes[finished] = 1 - finished_players
+                self.winner_indexes[finished] = np.where(won[done], finished_players, -1)
+                self.ply_counts[finished] = ply_counts[done]
+
+                playing = ~done
+                games, mask, players, ply_counts = games[playing], mask[playing], players[playing], ply_counts[playing]
+                moved, waiting = moved[playing], waiting[playing]
+
+            to_move, waiting = waiting, moved
+            players = 1 - players
+
+        return self.winners()
+
+
+class BatchRollout:
+    """ A rollout callable for CarloMontePlayer: rollout(state, player, depth) -> the average score for player """
+
+    def __init__(self, playouts=PLAYOUTS, seed=None):
+        self.playouts = playouts
+        # Seeded from random by default, so seeding random (like the arena does) makes the rollouts reproducible
+        self.rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+
+    def __call__(self, state, player, depth=0) -> float:
+        if not isinstance(state, FourInRowBitState):
+            state = FourInRowBitState.from_state(state)
+
+        winner = state.get_winner()
+        if winner is not None:
+            return player.win_score - depth if winner == player else -player.win_score + depth
+
+        winners, plies = self.play(state)
+        player_index = state.m_players.index(player)
+        scores = np.where(winners == player_index, player.win_score - plies - depth, -player.win_score + plies + depth)
+        return float(np.where(winners < 0, TIE_SCORE, scores).mean())
+
+    def play(self, state: FourInRowBitState, playouts=None):
+        """
+        Play random games from the state, returns the index of the winner of each (-1 for a tie) and its length
+        """
+        batch = FourInRowBatchState.from_state(state, playouts or self.playouts)
+        return batch.play_random(self.rng), batch.plies()
+
+
+class FourInRowBatchAiPlayer(CarloMontePlayer):
+    """ A Monte Carlo player that scores each new leaf by a batch of playouts, so it needs far fewer iterations """
+
+    def __init__(self, char, iterations=1000, playouts=PLAYOUTS, secs=None, **kwargs):
+        super().__init__(iterations, secs, rollout=BatchRollout(playouts), **kwargs)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
+
+
+def main():
+    import four_in_a_row
+
+    human_player = four_in_a_row.FourInRowHumanPlayer(four_in_a_row.HUMAN_CHAR)
+    ai_player = FourInRowBatchAiPlayer(four_in_a_row.AI_CHAR)
+    four_in_a_row_game = four_in_a_row.new_game([human_player, ai_player], observers=[game.ConsoleObserver()],
+                                                bitboard=True)
+
+    for _state in four_in_a_row_game.play():
+        pass
+
+
+if __name__ == '__main__':
+    main()
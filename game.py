@@ -1,8 +1,29 @@
 import abc
+import asyncio
+import functools
 import itertools
 import typing
 
 
+# Results of a solved state, for the player to move
+SOLVED_WIN = 1
+SOLVED_DRAW = 0
+SOLVED_LOSS = -1
+
+
+class _NotComputed:
+    """ The sentinel of a value that is computed lazily, it stays the same object through pickle and deepcopy """
+
+    def __reduce__(self):
+        return 'NOT_COMPUTED'
+
+    def __repr__(self):
+        return 'NOT_COMPUTED'
+
+
+NOT_COMPUTED = _NotComputed()
+
+
 def to_non_empty(iterable):
     try:
         return itertools.chain([next(iterable)], iterable)
@@ -10,21 +31,112 @@ def to_non_empty(iterable):
         return None
 
 
+def pack_2bit(values) -> bytes:
+    """ Pack a sequence of values in range(4), 4 values per byte """
+    values = list(values)
+    packed = bytearray((len(values) + 3) // 4)
+    for i, value in enumerate(values):
+        packed[i // 4] |= value << (2 * (i % 4))
+
+    return bytes(packed)
+
+
+def unpack_2bit(data: bytes, count: int) -> typing.List[int]:
+    return [(data[i // 4] >> (2 * (i % 4))) & 0b11 for i in range(count)]
+
+
+class BoardSymmetry:
+    """ A rotation or a mirror of a rows x cols board, as a permutation of its cells (numbered row by row) """
+
+    def __init__(self, rows, cols, transform):
+        """ transform - maps (row, col) to the (row, col) it moves to """
+        self.cell_map = tuple(row * cols + col
+                              for row, col in (transform(row, col) for row in range(rows) for col in range(cols)))
+        self.source = [0] * len(self.cell_map)  # The cell that moves to each cell
+        for cell, image in enumerate(self.cell_map):
+            self.source[image] = cell
+
+    def map_cells(self, cells) -> tuple:
+        """ The images of the cells, sorted """
+        return tuple(sorted(self.cell_map[cell] for cell in cells))
+
+    def permute(self, values) -> tuple:
+        """ Values by cell, as seen after the symmetry """
+        return tuple(values[cell] for cell in self.source)
+
+
+@functools.lru_cache(maxsize=None)
+def board_symmetries(rows, cols) -> typing.Tuple[BoardSymmetry, ...]:
+    """
+    The identity, the left-right mirror, the up-down mirror and the half turn of a board,
+    and of a square board also the diagonal mirrors and the quarter turns
+    """
+    last_row, last_col = rows - 1, cols - 1
+    transforms = [lambda row, col: (row, col),
+                  lambda row, col: (row, last_col - col),
+                  lambda row, col: (last_row - row, col),
+                  lambda row, col: (last_row - row, last_col - col)]
+    if rows == cols:
+        transforms += [lambda row, col: (col, row),
+                       lambda row, col: (last_col - col, last_row - row),
+                       lambda row, col: (col, last_row - row),
+                       lambda row, col: (last_col - col, row)]
+
+    return tuple(BoardSymmetry(rows, cols, transform) for transform in transforms)
+
+
 class Player(abc.ABC):
     @abc.abstractmethod
     def get_move(self, state: 'GameState'): pass
 
+    async def get_move_async(self, state: 'GameState'):
+        """ The move as an awaitable, by default get_move() runs in a thread so it does not block the event loop """
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_move, state)
+
+    def ponder(self, state: 'GameState'):
+        """ Think in the background while the opponent chooses its move in the state, until stop_pondering() """
+        pass
+
+    def stop_pondering(self):
+        pass
+
     def notify_bad_move(self):
         pass
 
     def notify_game_end(self, state):
         pass
 
+    def get_search_stats(self) -> typing.Optional[dict]:
+        """ Statistics about the search behind the last move, if the player searched for it """
+        return None
+
+    def describe_search(self) -> str:
+        stats = self.get_search_stats()
+        return ', '.join(f'{key}: {value}' for key, value in stats.items()) if stats else ''
+
+
+class PlaceholderPlayer(Player):
+    """ Stands for a player that only has a char, e.g. when replaying or decoding a state """
+
+    def __init__(self, char):
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+    def get_move(self, state):
+        raise NotImplementedError(f'{self} can not choose moves')
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
+
 
 class GameState(abc.ABC):
     # @abc.abstractstaticmethod
     # def initial_state(self) -> 'GameState': pass
 
+    EVAL_CHAR = None  # The char of the player eval() is from the point of view of, the first player's if None
+
     def __init__(self, players, player_index=0):
         self.m_players = players
         self.m_curr_player_index = player_index
@@ -36,8 +148,19 @@ class GameState(abc.ABC):
     def _next_player_index(self):
         return (self.m_curr_player_index + 1) % len(self.m_players)
 
-    def notify_move(self):
-        pass
+    def _char_codes(self):
+        """ Map each cell char to a small code: 0 for an empty cell and (index + 1) for the players chars """
+        codes = {player.get_char(): index + 1 for index, player in enumerate(self.m_players)}
+        codes[' '] = 0
+        return codes
+
+    @staticmethod
+    def _code_chars(players):
+        return [' '] + [player.get_char() for player in players]
+
+    def describe_move(self) -> str:
+        """ A human readable description of the move that led to this state """
+        return ''
 
     @abc.abstractmethod
     def get_winner(self) -> Player: pass
@@ -45,24 +168,194 @@ class GameState(abc.ABC):
     @abc.abstractmethod
     def eval(self) -> int: pass
 
+    def eval_for(self, player) -> int:
+        """ The evaluation from the point of view of the player, eval() negated for the players but EVAL_CHAR's """
+        eval_char = self.m_players[0].get_char() if self.EVAL_CHAR is None else self.EVAL_CHAR
+        score = self.eval()
+        return score if player.get_char() == eval_char else -score
+
     @abc.abstractmethod
     def get_moves(self) -> typing.Generator[int, None, None]: pass
 
+    def get_solution(self) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        The result of perfect play for the player to move (SOLVED_WIN, SOLVED_DRAW or SOLVED_LOSS) and the number of
+        plies until the game ends, or None if the state is not solved. Searches stop at solved states.
+        """
+        return None
+
+    def get_winning_move(self):
+        """ A move that wins right away for the player to move, or None. Games can find it faster than by trying. """
+        curr_player = self.get_curr_player()
+        return next((move for move in self.get_moves() if self.move(move).get_winner() is curr_player), None)
+
+    def canonical_key(self) -> typing.Optional[typing.Hashable]:
+        """
+        A key that is the same for this state and the states symmetric to it (by rotations and mirrors of the board),
+        so they can share what is known about them. None if the game does not define its symmetries.
+        """
+        return None
+
+    def canonical_move(self, move):
+        """ The move in the orientation of canonical_key(), symmetric moves of symmetric states are the same """
+        return move
+
+    def from_canonical_move(self, move):
+        """ The move of this state that canonical_move() maps to the move """
+        return move
+
+    def order_moves(self, moves: list) -> list:
+        """ Sort the moves so the most promising ones are searched first """
+        return moves
+
     def no_moves(self):
         return to_non_empty(self.get_moves()) is None
 
     @abc.abstractmethod
     def move(self, move) -> 'GameState': pass
 
+    def to_bytes(self) -> bytes:
+        """ Dense encoding of the state, without the players themselves """
+        raise NotImplementedError(f'{type(self).__name__} has no binary encoding')
+
+    @classmethod
+    def from_bytes(cls, data: bytes, players) -> 'GameState':
+        raise NotImplementedError(f'{cls.__name__} has no binary encoding')
+
+    def encode_move(self, move):
+        """ Convert a move to a JSON serializable value """
+        return move
+
+    def decode_move(self, data):
+        return tuple(data) if isinstance(data, list) else data
+
     @abc.abstractmethod
     def __eq__(self, other) -> bool:
         return self.m_curr_player_index == other.m_curr_player_index
 
 
+class BatchGameState(abc.ABC):
+    """
+    Many independent games of one kind kept as arrays (numpy), so every step plays a move in all of them at once.
+    A move is an index into range(move_count), like the moves of the game's GameState, and the players are indexes
+    into the players of the states the batch was made of. The vectors are indexed by game.
+    """
+    move_count: int
+
+    @classmethod
+    @abc.abstractmethod
+    def from_states(cls, states: typing.Sequence[GameState]) -> 'BatchGameState':
+        """ A batch of the states, which are of the same players """
+        pass
+
+    @classmethod
+    def from_state(cls, state: GameState, count: int) -> 'BatchGameState':
+        """ count copies of the state, e.g. to play many rollouts from it """
+        return cls.from_states([state] * count)
+
+    @abc.abstractmethod
+    def __len__(self) -> int: pass
+
+    @abc.abstractmethod
+    def current_players(self):
+        """ The index of the player to move in each game """
+        pass
+
+    @abc.abstractmethod
+    def legal_moves(self):
+        """ A (games, move_count) bool mask of the legal moves, all False in the games that are over """
+        pass
+
+    @abc.abstractmethod
+    def apply_moves(self, moves):
+        """ Play a move in each game, in place. The moves of the games that are over are ignored. """
+        pass
+
+    @abc.abstractmethod
+    def winners(self):
+        """ The index of the winner of each game, -1 if there is none (yet) """
+        pass
+
+    @abc.abstractmethod
+    def terminal(self):
+        """ Whether each game is over, by a win or by having no moves """
+        pass
+
+    @abc.abstractmethod
+    def plies(self):
+        """ The number of moves played in each game since the batch was made """
+        pass
+
+    @abc.abstractmethod
+    def get_state(self, index, players) -> GameState:
+        """ One of the games as a regular state """
+        pass
+
+    def play_random(self, rng):
+        """ Play uniformly random moves in all the games until they are over, returns the winners """
+        while not self.terminal().all():
+            legal = self.legal_moves()
+            # The legal moves get random keys in [1, 2) and the illegal ones in [0, 1), so the largest is legal
+            self.apply_moves((rng.random(legal.shape) + legal).argmax(axis=1))
+
+        return self.winners()
+
+
+class GameObserver:
+    """ Receives the events of a game. A game without observers formats and prints nothing. """
+
+    def on_game_start(self, state: GameState):
+        pass
+
+    def on_move(self, state: GameState, move, player: Player):
+        """ The player played the move, which led to the state """
+        pass
+
+    def on_illegal_move(self, state: GameState, move, player: Player):
+        pass
+
+    def on_search_finished(self, player: Player, stats: dict):
+        pass
+
+    def on_game_end(self, state: GameState, winner: Player):
+        pass
+
+
+class ConsoleObserver(GameObserver):
+    def __init__(self, print_search=True):
+        self.print_search = print_search
+
+    def on_game_start(self, state):
+        print(state)
+
+    def on_move(self, state, move, player):
+        print(state.describe_move())
+        print(state)
+
+    def on_search_finished(self, player, stats):
+        if self.print_search:
+            print(player.describe_search())
+
+    def on_game_end(self, state, winner):
+        if winner is not None:
+            print(f'The winner is {winner.get_char()}!')
+        else:
+            print(f'It\'s a tie!')
+
+
 class Game:
-    def __init__(self, start_state: GameState):
+    def __init__(self, start_state: GameState, observers=()):
         self.m_state: GameState = start_state
         self.m_winner: Player = None
+        self.m_last_move = None
+        self.m_observers: typing.List[GameObserver] = list(observers)
+
+    def add_observer(self, observer: GameObserver):
+        self.m_observers.append(observer)
+
+    def _notify(self, event, *args):
+        for observer in self.m_observers:
+            getattr(observer, event)(*args)
 
     def _is_tie(self):
         return self.m_state.no_moves()
@@ -79,18 +372,68 @@ class Game:
             new_state = self.m_state.move(move)
             if new_state is None:
                 curr_player.notify_bad_move()
+                self._notify('on_illegal_move', self.m_state, move, curr_player)
 
+        self._finish_move(curr_player, move, new_state)
+
+    async def _do_next_move_async(self, ponder):
+        new_state = None
+        curr_player = self.m_state.get_curr_player()
+        idle_players = [player for player in self.m_state.m_players if player is not curr_player] if ponder else []
+        for player in idle_players:
+            player.ponder(self.m_state)
+
+        try:
+            while new_state is None:
+                move = await curr_player.get_move_async(self.m_state)
+                new_state = self.m_state.move(move)
+                if new_state is None:
+                    curr_player.notify_bad_move()
+                    self._notify('on_illegal_move', self.m_state, move, curr_player)
+        finally:
+            for player in idle_players:
+                player.stop_pondering()
+
+        self._finish_move(curr_player, move, new_state)
+
+    def _finish_move(self, curr_player, move, new_state):
+        if self.m_observers:
+            stats = curr_player.get_search_stats()
+            if stats is not None:
+                self._notify('on_search_finished', curr_player, stats)
+
+        self.m_last_move = move
         self.m_state = new_state
-        self.m_state.notify_move()
+        self._notify('on_move', self.m_state, move, curr_player)
 
     def get_winner(self):
         return self.m_winner
 
     def play(self):
+        self._notify('on_game_start', self.m_state)
         yield self.m_state
         while not self._is_game_over():
             self._do_next_move()
             yield self.m_state
 
+        self._finish_game()
+
+    async def play_async(self, ponder=True):
+        """
+        Like play(), with the moves awaited, so players that wait for I/O (e.g. over the network) do not block.
+        With ponder, the players that are not on the move think on the opponent's time. That is meant for opponents
+        that do not use the CPU themselves, like humans and remote players.
+        """
+        self._notify('on_game_start', self.m_state)
+        yield self.m_state
+        while not self._is_game_over():
+            await self._do_next_move_async(ponder)
+            yield self.m_state
+
+        self._finish_game()
+
+    def _finish_game(self):
         for player in self.m_state.m_players:
             player.notify_game_end(self.m_state)
+
+        self._notify('on_game_end', self.m_state, self.m_winner)
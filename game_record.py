@@ -0,0 +1,131 @@
+"""
+Append-only JSONL records of played games.
+
+Every line is a single event of a single game, written as soon as it happens:
+    {"game": <id>, "type": "start", "state_class": "module.Class", "chars": [...], "state": <base64 of to_bytes()>}
+    {"game": <id>, "type": "move", "ply": <n>, "player": <index>, "move": <encoded move>, "ms": <n>, "stats": {...}}
+    {"game": <id>, "type": "end", "winner": <index or null>, "plies": <n>, "ms": <n>}
+"""
+import base64
+import importlib
+import json
+import time
+import typing
+import uuid
+
+import game
+
+
+class GameRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a')
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.file.flush()
+
+    def record(self, recorded_game: game.Game, game_id=None):
+        """ Play the game while recording it, yielding the states like game.Game.play() """
+        game_id = game_id or uuid.uuid4().hex
+        state = recorded_game.m_state
+        state_class = type(state)
+        self._write({'game': game_id,
+                     'type': 'start',
+                     'time': time.time(),
+                     'state_class': f'{state_class.__module__}.{state_class.__qualname__}',
+                     'chars': [player.get_char() for player in state.m_players],
+                     'state': base64.b64encode(state.to_bytes()).decode('ascii')})
+
+        ply = 0
+        start_time = move_time = time.time()
+        for state in recorded_game.play():
+            if ply:
+                now = time.time()
+                player_index = (state.m_curr_player_index - 1) % len(state.m_players)
+                self._write({'game': game_id,
+                             'type': 'move',
+                             'ply': ply,
+                             'player': player_index,
+                             'move': state.encode_move(recorded_game.m_last_move),
+                             'ms': int((now - move_time) * 1000),
+                             'stats': state.m_players[player_index].get_search_stats()})
+                move_time = now
+
+            ply += 1
+            yield state
+
+        winner = recorded_game.get_winner()
+        self._write({'game': game_id,
+                     'type': 'end',
+                     'winner': None if winner is None else state.m_players.index(winner),
+                     'plies': ply - 1,
+                     'ms': int((time.time() - start_time) * 1000)})
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+
+class GameRecord:
+    def __init__(self, start):
+        self.start = start
+        self.moves = []
+        self.end = None
+
+    @property
+    def game_id(self):
+        return self.start['game']
+
+    def is_finished(self):
+        return self.end is not None
+
+    def get_start_state(self, players=None) -> game.GameState:
+        module_name, class_name = self.start['state_class'].rsplit('.', 1)
+        state_class = getattr(importlib.import_module(module_name), class_name)
+        players = players or [game.PlaceholderPlayer(char) for char in self.start['chars']]
+        return state_class.from_bytes(base64.b64decode(self.start['state']), players)
+
+    def replay(self, players=None):
+        """ Yield the start state and the state after each of the recorded moves """
+        state = self.get_start_state(players)
+        yield state
+        for move in self.moves:
+            state = state.move(state.decode_move(move['move']))
+            if state is None:
+                raise ValueError(f'Game {self.game_id} has an illegal move at ply {move["ply"]}')
+            yield state
+
+
+def iter_records(path) -> typing.Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_games(path, include_unfinished=False) -> typing.Iterator[GameRecord]:
+    """
+    Yield the games of a records file as they finish.
+    Only the games that are still in progress at the current point of the file are kept in memory.
+    """
+    open_games = {}
+    for record in iter_records(path):
+        game_id = record['game']
+        if record['type'] == 'start':
+            open_games[game_id] = GameRecord(record)
+        elif game_id in open_games:
+            if record['type'] == 'move':
+                open_games[game_id].moves.append(record)
+            elif record['type'] == 'end':
+                game_record = open_games.pop(game_id)
+                game_record.end = record
+                yield game_record
+
+    if include_unfinished:
+        yield from open_games.values()
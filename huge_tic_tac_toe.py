@@ -1,3 +1,5 @@
+import functools
+
 import carlo_monte
 import game
 import minimax
@@ -32,49 +34,76 @@ class HugeTicTacHumanPlayer(game.Player):
 
 
 class HugeTicTacAiPlayer(carlo_monte.CarloMontePlayer):
-    def __init__(self, char):
-        super().__init__(3000)  # 9)
+    def __init__(self, char, iterations=3000):
+        super().__init__(iterations)
         self.m_char = char
 
     def get_char(self):
         return self.m_char
 
 
-class HugeTicTacState(game.GameState):
-    def __init__(self, sub_boards, players, main_board=None, last_move=None, player_index=0):
-        super().__init__(players, player_index)
-        self.last_move = last_move
+WIN_LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
+             (0, 3, 6), (1, 4, 7), (2, 5, 8),
+             (0, 4, 8), (2, 4, 6)]
+FULL_BOARD = 0b111111111
+
+# Lookup tables by a 9 bit mask of a board (bit i is cell i)
+IS_WIN = [any(all(mask >> i & 1 for i in line) for line in WIN_LINES) for mask in range(1 << 9)]
+EMPTY_CELLS = [tuple(i for i in range(9) if not mask >> i & 1) for mask in range(1 << 9)]
+# The first open sub-board, by the mask of closed sub-boards and the sub-board to start looking from
+NEXT_OPEN_BOARD = [[next(((start + i) % 9 for i in range(9) if not closed >> ((start + i) % 9) & 1), None)
+                    for start in range(9)]
+                   for closed in range(1 << 9)]
 
-        self.sub_boards = sub_boards
-        self.main_board = main_board if main_board else [' '] * 9
 
-        # Find the next sub-board
-        self.current_sub_board = self.last_move[1] if last_move else 0
+class HugeTicTacState(game.GameState):
+    """
+    Each player's stones are a 81 bit mask (sub-board i takes bits 9 * i to 9 * i + 8), and each player's won
+    sub-boards are a 9 bit mask of the main board. A sub-board is closed once it is won or full.
+    """
 
-        # Try all 9 boards until a free one is found
-        for i in range(10):
-            if self.main_board[self.current_sub_board] == ' ' and \
-                    any(cell == ' ' for cell in self.sub_boards[self.current_sub_board]):
-                break
-            else:
-                self.current_sub_board += 1
-                self.current_sub_board %= len(self.sub_boards)  # == 9
-        else:
-            self.current_sub_board = None
+    EVAL_CHAR = AI_CHAR
 
-        self.winner_found = False
+    def __init__(self, sub_boards, players, main_board=None, last_move=None, player_index=0):
+        super().__init__(players, player_index)
+        self.last_move = last_move
 
-    def notify_move(self):
-        print(f'Player {self.last_move[0].get_char()} '
-              f'played at cell {self.last_move[1] + 1} '
-              f'in sub-board {self.last_move[2] + 1}.')
+        main_board = main_board if main_board else [' '] * 9
+        chars = [player.get_char() for player in players]
+        self.boards = tuple(sum(1 << (9 * sub_board + cell)
+                                for sub_board in range(9) for cell in range(9)
+                                if sub_boards[sub_board][cell] == char)
+                            for char in chars)
+        self.main_boards = tuple(sum(1 << sub_board for sub_board in range(9) if main_board[sub_board] == char)
+                                 for char in chars)
+        self.occupied = functools.reduce(int.__or__, self.boards)
+        self.closed = sum(1 << sub_board for sub_board in range(9)
+                          if main_board[sub_board] != ' '
+                          or self._sub_board_mask(self.occupied, sub_board) == FULL_BOARD)
+
+        # Find the next sub-board, the first open one starting from the cell of the last move
+        self.current_sub_board = NEXT_OPEN_BOARD[self.closed][self.last_move[1] if last_move else 0]
+
+    @property
+    def sub_boards(self):
+        return [[next((player.get_char() for player, board in zip(self.m_players, self.boards)
+                       if board >> (9 * sub_board + cell) & 1), ' ')
+                 for cell in range(9)]
+                for sub_board in range(9)]
+
+    @property
+    def main_board(self):
+        return [next((player.get_char() for player, board in zip(self.m_players, self.main_boards)
+                      if board >> sub_board & 1), ' ')
+                for sub_board in range(9)]
+
+    def describe_move(self):
+        return f'Player {self.last_move[0].get_char()} ' \
+               f'played at cell {self.last_move[1] + 1} ' \
+               f'in sub-board {self.last_move[2] + 1}.'
 
     def get_winner_in_board(self, board):
-        sets = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
-                (0, 3, 6), (1, 4, 7), (2, 5, 8),
-                (0, 4, 8), (2, 4, 6)]
-
-        for a, b, c in sets:
+        for a, b, c in WIN_LINES:
             if board[a] != ' ' and \
                     board[a] == board[b] and board[a] == board[c]:
                 return next((p for p in self.m_players if p.get_char() == board[a]), None)
@@ -82,7 +111,11 @@ class HugeTicTacState(game.GameState):
         return None
 
     def get_winner(self):
-        return self.get_winner_in_board(self.main_board)
+        for player, main_board in zip(self.m_players, self.main_boards):
+            if IS_WIN[main_board]:
+                return player
+
+        return None
 
     def eval(self):
         winner = self.get_winner()
@@ -92,41 +125,80 @@ class HugeTicTacState(game.GameState):
 
         return minimax.INF if winner.get_char() == AI_CHAR else -minimax.INF
 
+    def _sub_board_mask(self, board, sub_board):
+        return (board >> (9 * sub_board)) & FULL_BOARD
+
     def get_moves(self):
         if self.current_sub_board is None:
             return iter([])  # No moves
 
-        return (i for i, cell in enumerate(self.sub_boards[self.current_sub_board]) if cell == ' ')
+        return iter(EMPTY_CELLS[self._sub_board_mask(self.occupied, self.current_sub_board)])
 
     def move(self, move: int):
-        if move in range(len(self.sub_boards[self.current_sub_board])) \
-                and self.sub_boards[self.current_sub_board][move] == ' ':
-            # copy only the sub-board that is about to change
-            new_sub_boards = [sub_board if index != self.current_sub_board else sub_board[::]
-                              for index, sub_board in enumerate(self.sub_boards)]
-            new_sub_boards[self.current_sub_board][move] = self.get_curr_player().get_char()
-            if self.get_winner_in_board(new_sub_boards[self.current_sub_board]):
-                new_main_board = self.main_board[::]
-                new_main_board[self.current_sub_board] = self.get_curr_player().get_char()
-            else:
-                new_main_board = self.main_board
-
-            last_move = (self.get_curr_player(), move, self.current_sub_board)
-            return HugeTicTacState(new_sub_boards, self.m_players, new_main_board, last_move, self._next_player_index())
+        sub_board = self.current_sub_board
+        if sub_board is None or move not in range(9):
+            return None
+
+        cell_bit = 1 << (9 * sub_board + move)
+        if self.occupied & cell_bit:
+            return None
+
+        index = self.m_curr_player_index
+        board = self.boards[index] | cell_bit
+        closed = self.closed
+        main_boards = self.main_boards
+        if IS_WIN[self._sub_board_mask(board, sub_board)]:
+            closed |= 1 << sub_board
+            main_boards = main_boards[:index] + (main_boards[index] | 1 << sub_board,) + main_boards[index + 1:]
+        elif self._sub_board_mask(self.occupied | cell_bit, sub_board) == FULL_BOARD:
+            closed |= 1 << sub_board
+
+        # Skip the constructor, everything is already known
+        new_state = object.__new__(HugeTicTacState)
+        new_state.m_players = self.m_players
+        new_state.m_curr_player_index = self._next_player_index()
+        new_state.m_moves = None
+        new_state.last_move = (self.get_curr_player(), move, sub_board)
+        new_state.boards = self.boards[:index] + (board,) + self.boards[index + 1:]
+        new_state.occupied = self.occupied | cell_bit
+        new_state.main_boards = main_boards
+        new_state.closed = closed
+        new_state.current_sub_board = NEXT_OPEN_BOARD[closed][move]
+        return new_state
+
+    def to_bytes(self):
+        # Header: player index and whether there is a last move, then the last move cell and sub-board (4 bits each),
+        # then 2 bits per cell of the sub-boards followed by the main board
+        codes = self._char_codes()
+        cell, sub_board = self.last_move[1:] if self.last_move else (0, 0)
+        header = bytes([self.m_curr_player_index | (self.last_move is not None) << 2, cell | sub_board << 4])
+        return header + game.pack_2bit([codes[c] for sub_board in self.sub_boards for c in sub_board] +
+                                       [codes[c] for c in self.main_board])
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        player_index, has_last_move = data[0] & 0b11, data[0] >> 2
+        chars = cls._code_chars(players)
+        flat = [chars[code] for code in game.unpack_2bit(data[2:], 9 * 9 + 9)]
+        sub_boards = [flat[i * 9:(i + 1) * 9] for i in range(9)]
+        last_move = (players[(player_index - 1) % len(players)], data[1] & 0xF, data[1] >> 4) \
+            if has_last_move else None
+        return HugeTicTacState(sub_boards, players, flat[81:], last_move, player_index)
 
     def __eq__(self, other) -> bool:
-        return super().__eq__(other) and self.sub_boards == other.sub_boards
+        return super().__eq__(other) and self.boards == other.boards
 
     def __str__(self):
         ret = ''
+        sub_boards, main_board = self.sub_boards, self.main_board
 
         for row in range(9):
             for col in range(9):
                 sub_board = (row // 3) * 3 + (col // 3)
                 cell_index = (row % 3) * 3 + (col % 3)
 
-                if self.main_board[sub_board] == ' ':
-                    cell = self.sub_boards[sub_board][cell_index]
+                if main_board[sub_board] == ' ':
+                    cell = sub_boards[sub_board][cell_index]
 
                     if cell != ' ':
                         cell_char = cell
@@ -135,7 +207,7 @@ class HugeTicTacState(game.GameState):
                     else:
                         cell_char = '.'
                 else:
-                    cell_char = ' ' if cell_index != 4 else self.main_board[sub_board]
+                    cell_char = ' ' if cell_index != 4 else main_board[sub_board]
 
                 sep = '|' if col % 3 == 2 and col != 8 else ' '
                 ret += cell_char + sep
@@ -155,20 +227,18 @@ class HugeTicTacState(game.GameState):
         return ret + '\n'
 
 
-def main():
+def new_game(players, observers=()):
     board = [[' ' for _ in range(9)] for _ in range(9)]
+    return game.Game(HugeTicTacState(board, players), observers)
+
+
+def main():
     human_player = HugeTicTacHumanPlayer(HUMAN_CHAR)
     ai_player = HugeTicTacAiPlayer(AI_CHAR)
-    tictac_game = game.Game(HugeTicTacState(board, [human_player, ai_player]))
-
-    for state in tictac_game.play():
-        print(state)
+    tictac_game = new_game([human_player, ai_player], observers=[game.ConsoleObserver()])
 
-    winner = tictac_game.get_winner()
-    if winner is not None:
-        print(f'The winner is {winner.get_char()}!')
-    else:
-        print(f'It\'s a tie!')
+    for _state in tictac_game.play():
+        pass
 
 
 if __name__ == '__main__':
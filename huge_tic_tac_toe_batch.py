@@ -0,0 +1,108 @@
+"""
+Huge tic tac toe games in a batch (game.BatchGameState): a 9 bit mask per player and sub-board, and a 9 bit mask of
+the won sub-boards per player, in each game. The moves are cells of the current sub-board, as in HugeTicTacState.
+
+Needs numpy.
+"""
+import numpy as np
+
+import game
+from huge_tic_tac_toe import FULL_BOARD, IS_WIN, NEXT_OPEN_BOARD, HugeTicTacState
+
+CELL_BITS = 1 << np.arange(9, dtype=np.uint16)
+IS_WIN_TABLE = np.array(IS_WIN)
+# -1 for no open sub-board
+NEXT_OPEN_BOARD_TABLE = np.array([[-1 if sub_board is None else sub_board for sub_board in row]
+                                  for row in NEXT_OPEN_BOARD], dtype=np.int8)
+
+
+class HugeTicTacBatchState(game.BatchGameState):
+    move_count = 9
+
+    def __init__(self, boards, main_boards, closed, current_sub_boards, player_indexes):
+        """
+        boards - a (games, 2, 9) array of the cells masks of each player in each sub-board
+        main_boards - a (games, 2) array of the won sub-boards masks of each player
+        """
+        self.boards = boards
+        self.main_boards = main_boards
+        self.closed = closed
+        self.current_sub_boards = current_sub_boards
+        self.player_indexes = player_indexes
+        self.winner_indexes = np.where(IS_WIN_TABLE[main_boards[:, 0]], 0,
+                                       np.where(IS_WIN_TABLE[main_boards[:, 1]], 1, -1)).astype(np.int8)
+        self.ply_counts = np.zeros(len(boards), dtype=np.int32)
+
+    @classmethod
+    def from_states(cls, states):
+        assert len(states[0].m_players) == 2, 'The batch is of two players games'
+        boards = np.array([[[(board >> (9 * sub_board)) & FULL_BOARD for sub_board in range(9)]
+                            for board in state.boards]
+                           for state in states], dtype=np.uint16)
+        return cls(boards,
+                   np.array([state.main_boards for state in states], dtype=np.uint16),
+                   np.array([state.closed for state in states], dtype=np.uint16),
+                   np.array([-1 if state.current_sub_board is None else state.current_sub_board for state in states],
+                            dtype=np.int8),
+                   np.array([state.m_curr_player_index for state in states], dtype=np.int8))
+
+    @classmethod
+    def new(cls, count):
+        """ count games from the empty board """
+        return cls(np.zeros((count, 2, 9), dtype=np.uint16), np.zeros((count, 2), dtype=np.uint16),
+                   np.zeros(count, dtype=np.uint16), np.zeros(count, dtype=np.int8), np.zeros(count, dtype=np.int8))
+
+    def __len__(self):
+        return len(self.boards)
+
+    def current_players(self):
+        return self.player_indexes
+
+    def legal_moves(self):
+        games = np.arange(len(self.boards))
+        sub_boards = np.maximum(self.current_sub_boards, 0)
+        occupied = self.boards[games, 0, sub_boards] | self.boards[games, 1, sub_boards]
+        return ((occupied[:, None] & CELL_BITS) == 0) & ~self.terminal()[:, None]
+
+    def apply_moves(self, moves):
+        games = np.flatnonzero(~self.terminal())
+        moves = np.asarray(moves)[games]
+        players = self.player_indexes[games]
+        sub_boards = self.current_sub_boards[games]
+        sub_board_bits = (1 << sub_boards.astype(np.uint16)).astype(np.uint16)
+
+        boards = self.boards[games, players, sub_boards] | CELL_BITS[moves]
+        self.boards[games, players, sub_boards] = boards
+        full = (boards | self.boards[games, 1 - players, sub_boards]) == FULL_BOARD
+        won = IS_WIN_TABLE[boards]
+
+        main_boards = self.main_boards[games, players] | np.where(won, sub_board_bits, 0).astype(np.uint16)
+        self.main_boards[games, players] = main_boards
+        closed = self.closed[games] | np.where(won | full, sub_board_bits, 0).astype(np.uint16)
+        self.closed[games] = closed
+
+        self.current_sub_boards[games] = NEXT_OPEN_BOARD_TABLE[closed, moves]
+        self.winner_indexes[games] = np.where(IS_WIN_TABLE[main_boards], players, -1)
+        self.player_indexes[games] = 1 - players
+        self.ply_counts[games] += 1
+
+    def winners(self):
+        return self.winner_indexes
+
+    def terminal(self):
+        return (self.winner_indexes >= 0) | (self.current_sub_boards < 0)
+
+    def plies(self):
+        return self.ply_counts
+
+    def get_state(self, index, players):
+        chars = [player.get_char() for player in players]
+        sub_boards = [[next((char for char, board in zip(chars, self.boards[index, :, sub_board]) if board >> i & 1),
+                            ' ')
+                       for i in range(9)]
+                      for sub_board in range(9)]
+        main_board = [next((char for char, board in zip(chars, self.main_boards[index]) if board >> i & 1), ' ')
+                      for i in range(9)]
+        state = HugeTicTacState(sub_boards, players, main_board, player_index=int(self.player_indexes[index]))
+        state.current_sub_board = None if self.current_sub_boards[index] < 0 else int(self.current_sub_boards[index])
+        return state
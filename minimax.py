@@ -10,9 +10,28 @@ TIE_SCORE = 0
 class MinimaxPlayer(game.Player):
     def __init__(self, depth):
         self.depth = depth
+        self.last_score = None
 
     def get_move(self, state):
-        return minimax_alpha_beta([], state, self, self.depth)[0]
+        move, self.last_score = minimax_alpha_beta([], state, self, self.depth)
+        return move
+
+    def get_search_stats(self):
+        return {'depth': self.depth, 'score': self.last_score}
+
+
+class MinimaxCharPlayer(MinimaxPlayer):
+    """ A minimax player of any game that only needs the char of its players """
+
+    def __init__(self, char, depth):
+        super().__init__(depth)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
 
 
 def minimax_alpha_beta(moves_log, state: game.GameState, max_player: MinimaxPlayer, max_depth=5, depth=0, alpha=-INF,
@@ -23,15 +42,25 @@ def minimax_alpha_beta(moves_log, state: game.GameState, max_player: MinimaxPlay
         score = INF - depth if winner is max_player else -INF + depth
         return NO_MOVE, score  # state.eval_state()
 
+    solution = state.get_solution() if depth > 0 else None
+    if solution is not None:
+        result, plies = solution
+        if result == game.SOLVED_DRAW:
+            return NO_MOVE, TIE_SCORE
+
+        max_player_wins = (result == game.SOLVED_WIN) == (state.get_curr_player() is max_player)
+        return NO_MOVE, INF - depth - plies if max_player_wins else -INF + depth + plies
+
     moves = game.to_non_empty(state.get_moves())
     if not moves:
         return NO_MOVE, TIE_SCORE
 
-    moves = list(moves)
-    random.shuffle(moves)
-
     if depth >= max_depth:
-        return NO_MOVE, state.eval()
+        return NO_MOVE, state.eval_for(max_player)
+
+    moves = list(moves)
+    random.shuffle(moves)  # Randomize between moves the ordering considers equal
+    moves = state.order_moves(moves)
 
     is_max_player = (depth % 2 == 0)
     best_moves = []
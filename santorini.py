@@ -3,7 +3,10 @@ import struct
 from enum import Enum
 
 import game
+import minimax
 from carlo_monte import CarloMontePlayer
+from santorini_protocol import (CLIENT_FIRST, FRAME_SIZE, HOST, PORT, SERVER_FIRST, ProtocolError, frame,
+                                parse_session_frame)
 
 P1_CHAR = '()'
 P2_CHAR = '[]'
@@ -11,6 +14,17 @@ P2_CHAR = '[]'
 ROWS = 5
 COLS = 5
 
+NO_LAST_MOVE = 0xFF
+NOT_COMPUTED = game.NOT_COMPUTED
+
+# Evaluation weights
+WORKER_HEIGHT_SCORES = [0, 30, 100, 0]  # A worker on height 3 has already won
+MOBILITY_SCORE = 2  # Per free neighbour a worker can walk to
+CLIMB_SCORE = 10  # Per free neighbour one level above a worker
+BUILD_THREAT_SCORE = 15  # Per free height 2 neighbour of a worker on height 2, a build away from a win threat
+WIN_THREAT_SCORE = 150  # Per free height 3 neighbour of a worker on height 2
+WINNING_SCORE = minimax.INF // 2  # The player to move has a win threat, it wins on its move
+
 
 class Direction(Enum):
     NORTH = 'n'
@@ -23,18 +37,82 @@ class Direction(Enum):
     SOUTH_EAST = 'se'
 
     def as_diff(self):
-        AS_DIFF = {
-            Direction.NORTH.value: (-1, 0),
-            Direction.SOUTH.value: (1, 0),
-            Direction.WEST.value: (0, -1),
-            Direction.EAST.value: (0, 1),
-            Direction.NORTH_WEST.value: (-1, -1),
-            Direction.NORTH_EAST.value: (-1, 1),
-            Direction.SOUTH_WEST.value: (1, -1),
-            Direction.SOUTH_EAST.value: (1, 1)
-        }
+        return DIRECTION_DIFFS[self]
+
+
+DIRECTIONS = list(Direction)
+DIRECTION_INDEXES = {direction: index for index, direction in enumerate(DIRECTIONS)}
+DIRECTION_DIFFS = {
+    Direction.NORTH: (-1, 0),
+    Direction.SOUTH: (1, 0),
+    Direction.WEST: (0, -1),
+    Direction.EAST: (0, 1),
+    Direction.NORTH_WEST: (-1, -1),
+    Direction.NORTH_EAST: (-1, 1),
+    Direction.SOUTH_WEST: (1, -1),
+    Direction.SOUTH_EAST: (1, 1)
+}
+
+
+def _neighbour_cell(cell, direction):
+    row_diff, col_diff = direction.as_diff()
+    row, col = cell // COLS + row_diff, cell % COLS + col_diff
+    return row * COLS + col if 0 <= row < ROWS and 0 <= col < COLS else None
+
+
+# The cells are numbered row by row, NEIGHBOUR_CELLS[cell][direction index] is None outside the board
+NEIGHBOUR_CELLS = [[_neighbour_cell(cell, direction) for direction in DIRECTIONS] for cell in range(ROWS * COLS)]
+# (direction index, cell) of the neighbours inside the board, in the order of Direction
+NEIGHBOURS = [[(index, neighbour) for index, neighbour in enumerate(neighbours) if neighbour is not None]
+              for neighbours in NEIGHBOUR_CELLS]
+
+
+SYMMETRIES = game.board_symmetries(ROWS, COLS)
+CENTER = (ROWS // 2) * COLS + COLS // 2
+
+
+def _direction_image(symmetry, direction_index):
+    image = symmetry.cell_map[NEIGHBOUR_CELLS[CENTER][direction_index]]
+    return next(index for index, cell in enumerate(NEIGHBOUR_CELLS[symmetry.cell_map[CENTER]]) if cell == image)
+
+
+# By symmetry index, the direction index each direction index turns into, and back
+DIRECTION_MAPS = [[_direction_image(symmetry, index) for index in range(len(DIRECTIONS))] for symmetry in SYMMETRIES]
+DIRECTION_SOURCES = [[direction_map.index(index) for index in range(len(DIRECTIONS))]
+                     for direction_map in DIRECTION_MAPS]
+
+
+def int_move(worker, walk: Direction, build: Direction) -> int:
+    """ A move as a small integer: the worker and the walk and build direction indexes, 3 bits each """
+    return worker << 6 | DIRECTION_INDEXES[walk] << 3 | DIRECTION_INDEXES[build]
 
-        return AS_DIFF[self.value]
+
+def tuple_move(move: int) -> (int, Direction, Direction):
+    return move >> 6, DIRECTIONS[(move >> 3) & 0b111], DIRECTIONS[move & 0b111]
+
+
+def move_to_text(move) -> str:
+    """ The 7 characters network format of a move, e.g. '0 nw  e' """
+    worker, walk, build = tuple_move(move) if isinstance(move, int) else move
+
+    def direction_to_str(direction):
+        if direction in (Direction.EAST, Direction.WEST):
+            return ' ' + direction.value
+        else:
+            return f'{direction.value:2}'
+
+    return f'{worker} {direction_to_str(walk)} {direction_to_str(build)}'
+
+
+def move_from_text(text) -> int:
+    worker = int(text[0])
+    walk = Direction(text[2:4].replace(' ', ''))
+    build = Direction(text[5:7].replace(' ', ''))
+    return int_move(worker, walk, build)
+
+
+def move_frame(move) -> bytes:
+    return frame(move_to_text(move))
 
 
 class SantoriniHumanPlayer(game.Player):
@@ -68,47 +146,80 @@ class SantoriniHumanPlayer(game.Player):
 
 
 class SantoriniNetworkPlayer(game.Player):
+    """
+    The AI of a santorini_server.SantoriniServer, as a blocking player of a local game.
+    Speaks the server's 8 byte frames, without resuming the session if the connection breaks.
+    """
+
     def __init__(self, char, address):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
-        self.socket.connect(address)
+        self.socket = socket.create_connection(address)
         self.m_char = char
+        self.session_id = None
 
-    def send_opponent_move(self, state):
-        _player, worker, walk, build = state.last_move
+    def _send(self, data: bytes):
+        self.socket.sendall(data)
 
-        def direction_to_str(direction):
-            if direction in (Direction.EAST, Direction.WEST):
-                return ' ' + direction.value
-            else:
-                return f'{direction.value:2}'
+    def _receive(self) -> bytes:
+        """ The next frame, TCP may deliver it in parts """
+        data = b''
+        while len(data) < FRAME_SIZE:
+            chunk = self.socket.recv(FRAME_SIZE - len(data))
+            if not chunk:
+                raise ConnectionError('The server closed the connection')
+            data += chunk
 
-        move = f'{worker} {direction_to_str(walk)} {direction_to_str(build)}'
-        self.socket.send(move.encode('ascii'))
+        if data.startswith(b'#E'):
+            raise ProtocolError(f'Server error {data[2:].decode("ascii").strip()}')
 
-    def get_move(self, state: 'SantoriniState'):
-        self.send_opponent_move(state)
+        return data
 
-        inputs = self.socket.recv(8).decode('ascii')
+    def send_opponent_move(self, state):
+        """ Start the session on the first call, and send the opponent's last move if there is one """
+        if self.session_id is None:
+            self._send(frame(f'#N{SERVER_FIRST if state.last_move is None else CLIENT_FIRST}'))
+            data = self._receive()
+            if not data.startswith(b'#S'):
+                raise ProtocolError(f'Unexpected reply {data!r}')
+            self.session_id, _ply = parse_session_frame(data)
 
-        worker = int(inputs[0])
-        walk = Direction(inputs[2:4].replace(' ', ''))
-        build = Direction(inputs[5:7].replace(' ', ''))
-        return worker, walk, build
+        if state.last_move is not None and state.last_move[0] is not self:
+            self._send(move_frame(state.last_move[1:]))
+
+    def get_move(self, state: 'SantoriniState'):
+        self.send_opponent_move(state)
+        return move_from_text(self._receive().decode('ascii'))
 
     def get_char(self):
         return self.m_char
 
     def notify_game_end(self, state):
-        self.send_opponent_move(state)
-        self.socket.close()
+        try:
+            if self.session_id is not None:
+                self.send_opponent_move(state)
+                while not self._receive().startswith(b'#G'):
+                    pass
+        finally:
+            self.socket.close()
+
+    def __str__(self):
+        return f'PLAYER_{self.m_char}'
+
+
+class SantoriniAiPlayer(CarloMontePlayer):
+    def __init__(self, char, iterations, secs=None, think_ahead=False, rollout_depth=None):
+        super().__init__(iterations, secs, think_ahead, rollout_depth)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
 
     def __str__(self):
         return f'PLAYER_{self.m_char}'
 
 
-class SantoriniAiPlayer(CarloMontePlayer):  # minimax.MinimaxPlayer):
-    def __init__(self, char, iterations, secs=None, think_ahead=False):
-        super().__init__(iterations, secs, think_ahead)
+class SantoriniMinimaxPlayer(minimax.MinimaxPlayer):
+    def __init__(self, char, depth=2):
+        super().__init__(depth)
         self.m_char = char
 
     def get_char(self):
@@ -119,120 +230,265 @@ class SantoriniAiPlayer(CarloMontePlayer):  # minimax.MinimaxPlayer):
 
 
 class SantoriniState(game.GameState):
+    """
+    The heights are a flat list of the cells, numbered row by row, and each player's workers are a tuple of cells.
+    occupied is a bitmask of the cells that have a worker on them.
+    """
     WORKERS_NUMBER = 2
     MAX_BUILD_HEIGHT = 4
+    rows = ROWS
+    cols = COLS
 
     def __init__(self, cells, players, workers, last_move=None, player_index=0):
         super().__init__(players, player_index)
         self.last_move = last_move
-        self.workers = workers
-        self.cells = cells
-        self.rows = len(self.cells)
-        self.cols = len(self.cells[0])
-
-    def notify_move(self):
-        print(f'Player {self.last_move[0].get_char()} '
-              f'moved worker #{self.last_move[1]} '
-              f'to {self.last_move[2]} '
-              f'and built at {self.last_move[3]}.')
-        print(f'{self.last_move[1]} {self.last_move[2].value} {self.last_move[3].value}\n')
-
-    def in_board(self, row, col):
-        return 0 <= row < self.rows and 0 <= col < self.cols
+        self.heights = [height for row in cells for height in row]
+        self.worker_cells = tuple(tuple(row * COLS + col for row, col in player_workers) for player_workers in workers)
+        self.occupied = 0
+        for player_workers in self.worker_cells:
+            for cell in player_workers:
+                self.occupied |= 1 << cell
+
+        self.winner = NOT_COMPUTED
+
+    @property
+    def cells(self):
+        return [self.heights[row * COLS:(row + 1) * COLS] for row in range(ROWS)]
+
+    @property
+    def workers(self):
+        return [[divmod(cell, COLS) for cell in player_workers] for player_workers in self.worker_cells]
+
+    def describe_move(self):
+        return f'Player {self.last_move[0].get_char()} ' \
+               f'moved worker #{self.last_move[1]} ' \
+               f'to {self.last_move[2]} ' \
+               f'and built at {self.last_move[3]}.\n' \
+               f'{self.last_move[1]} {self.last_move[2].value} {self.last_move[3].value}\n'
 
     def get_winner(self):
-        if self.no_moves():
-            return self.m_players[self._next_player_index()]
+        if self.winner is NOT_COMPUTED:
+            self.winner = self._find_winner()
 
-        for player, workers in zip(self.m_players, self.workers):
-            for worker_row, worker_col in workers:
-                if self.cells[worker_row][worker_col] == self.MAX_BUILD_HEIGHT - 1:
+        return self.winner
+
+    def _find_winner(self):
+        for player, workers in zip(self.m_players, self.worker_cells):
+            for cell in workers:
+                if self.heights[cell] == self.MAX_BUILD_HEIGHT - 1:
                     return player
 
+        # A player that cannot move loses
+        if not self.moves:
+            return self.m_players[self._next_player_index()]
+
         return None
 
     def eval(self):
-        return 0
-
-    # TODO: we can do this in O(1) and not O(4), or at least cache it
-    def is_worker_location(self, row, col, about_to_move=None):
-        if not about_to_move or (row, col) != about_to_move:
-            for workers in self.workers:
-                if (row, col) in workers:
-                    return True
-        return False
+        return self.eval_for(self.m_players[0])
+
+    def eval_for(self, player):
+        index = self.m_players.index(player)
+        score, threats = self._eval_workers(index)
+        other_score, other_threats = self._eval_workers(1 - index)
+
+        # The player to move wins by climbing, unless it has no moves at all (which get_winner() takes care of)
+        if self.m_curr_player_index == index and threats:
+            return WINNING_SCORE
+        if self.m_curr_player_index != index and other_threats:
+            return -WINNING_SCORE
+
+        return score + threats * WIN_THREAT_SCORE - other_score - other_threats * WIN_THREAT_SCORE
+
+    def _eval_workers(self, player_index):
+        """ The score of the player's workers, and the number of their win threats """
+        heights = self.heights
+        occupied = self.occupied
+        score = 0
+        threats = 0
+        for cell in self.worker_cells[player_index]:
+            height = heights[cell]
+            score += WORKER_HEIGHT_SCORES[height]
+            for _direction, neighbour in NEIGHBOURS[cell]:
+                if occupied >> neighbour & 1:
+                    continue
+
+                neighbour_height = heights[neighbour]
+                if neighbour_height <= height:
+                    score += MOBILITY_SCORE
+                    if neighbour_height == 2:
+                        score += BUILD_THREAT_SCORE
+                elif neighbour_height == height + 1:
+                    if neighbour_height == self.MAX_BUILD_HEIGHT - 1:
+                        threats += 1
+                    else:
+                        score += MOBILITY_SCORE + CLIMB_SCORE
+
+        return score, threats
+
+    def _canonical(self):
+        """
+        The smallest form of the board as seen through the symmetries, and the index of that symmetry.
+        The workers of a player are interchangeable, so they are sorted by cell.
+        """
+        return min(((symmetry.permute(self.heights), tuple(map(symmetry.map_cells, self.worker_cells))), index)
+                   for index, symmetry in enumerate(SYMMETRIES))
+
+    def canonical_key(self):
+        return self._canonical()[0], self.m_curr_player_index
+
+    def canonical_move(self, move):
+        if not isinstance(move, int):
+            move = int_move(*move)
+
+        index = self._canonical()[1]
+        symmetry = SYMMETRIES[index]
+        player_workers = self.worker_cells[self.m_curr_player_index]
+        worker = symmetry.map_cells(player_workers).index(symmetry.cell_map[player_workers[move >> 6]])
+        direction_map = DIRECTION_MAPS[index]
+        return worker << 6 | direction_map[(move >> 3) & 0b111] << 3 | direction_map[move & 0b111]
+
+    def from_canonical_move(self, move):
+        index = self._canonical()[1]
+        symmetry = SYMMETRIES[index]
+        player_workers = self.worker_cells[self.m_curr_player_index]
+        worker = player_workers.index(symmetry.source[symmetry.map_cells(player_workers)[move >> 6]])
+        direction_sources = DIRECTION_SOURCES[index]
+        return worker << 6 | direction_sources[(move >> 3) & 0b111] << 3 | direction_sources[move & 0b111]
+
+    @property
+    def moves(self):
+        """ The moves are generated once, get_winner(), no_moves() and get_moves() all share them """
+        if self.m_moves is None:
+            self.m_moves = list(self._generate_moves())
+
+        return self.m_moves
 
     def get_moves(self):
-        for worker_id, (worker_row, worker_col) in enumerate(self.workers[self.m_curr_player_index]):
-            worker_height = self.cells[worker_row][worker_col]
-
-            for walk_dir in Direction:
-                row_diff, col_diff = walk_dir.as_diff()
-                new_row, new_col = worker_row + row_diff, worker_col + col_diff
-                if not self.in_board(new_row, new_col) \
-                        or self.cells[new_row][new_col] > worker_height + 1 \
-                        or self.is_worker_location(new_row, new_col):
-                    continue
+        return iter(self.moves)
+
+    def no_moves(self):
+        return not self.moves
 
-                for build_dir in Direction:
-                    row_diff, col_diff = build_dir.as_diff()
-                    build_row, build_col = new_row + row_diff, new_col + col_diff
-                    if self.in_board(build_row, build_col) \
-                            and self.cells[build_row][build_col] < self.MAX_BUILD_HEIGHT \
-                            and not self.is_worker_location(build_row, build_col,
-                                                            about_to_move=(worker_row, worker_col)):
-                        yield worker_id, walk_dir, build_dir
-
-    def move(self, move: (int, Direction, Direction)):
-        worker_id, walk_dir, build_dir = move
-        worker_row, worker_col = self.workers[self.m_curr_player_index][worker_id]
-        worker_height = self.cells[worker_row][worker_col]
-
-        walk_row_diff, walk_col_diff = walk_dir.as_diff()
-        new_row, new_col = worker_row + walk_row_diff, worker_col + walk_col_diff
-
-        if self.in_board(new_row, new_col) \
-                and self.cells[new_row][new_col] <= worker_height + 1 \
-                and not self.is_worker_location(new_row, new_col):
-            row_diff, col_diff = build_dir.as_diff()
-            build_row, build_col = new_row + row_diff, new_col + col_diff
-            if self.in_board(build_row, build_col) \
-                    and self.cells[build_row][build_col] < self.MAX_BUILD_HEIGHT \
-                    and not self.is_worker_location(build_row, build_col, about_to_move=(worker_row, worker_col)):
-                new_cells = [r if index != build_row else r[::] for index, r in
-                             enumerate(self.cells)]  # copy only the row that is about to change
-                new_cells[build_row][build_col] = self.cells[build_row][build_col] + 1
-
-                new_workers = [w if index != self.m_curr_player_index else w[::] for index, w in
-                               enumerate(self.workers)]  # copy only the row that is about to change
-                new_workers[self.m_curr_player_index][worker_id] = (new_row, new_col)
-
-                last_move = (self.get_curr_player(), *move)
-                return SantoriniState(cells=new_cells,
-                                      players=self.m_players,
-                                      workers=new_workers,
-                                      last_move=last_move,
-                                      player_index=self._next_player_index())
+    def get_winning_move(self):
+        """ A move that climbs to height 3 """
+        player_workers = self.worker_cells[self.m_curr_player_index]
+        for move in self.moves:
+            walk_cell = NEIGHBOUR_CELLS[player_workers[move >> 6]][(move >> 3) & 0b111]
+            if self.heights[walk_cell] == self.MAX_BUILD_HEIGHT - 1:
+                return move
 
         return None
 
+    def _generate_moves(self):
+        heights = self.heights
+        occupied = self.occupied
+        for worker_id, cell in enumerate(self.worker_cells[self.m_curr_player_index]):
+            max_walk_height = heights[cell] + 1
+            occupied_after_walk = occupied & ~(1 << cell)  # The worker may build where it stood
+
+            for walk_dir, walk_cell in NEIGHBOURS[cell]:
+                if heights[walk_cell] > max_walk_height or occupied >> walk_cell & 1:
+                    continue
+
+                for build_dir, build_cell in NEIGHBOURS[walk_cell]:
+                    if heights[build_cell] < self.MAX_BUILD_HEIGHT and not occupied_after_walk >> build_cell & 1:
+                        yield worker_id << 6 | walk_dir << 3 | build_dir
+
+    def move(self, move):
+        """ The move is either an int_move() or a (worker, walk direction, build direction) tuple """
+        if not isinstance(move, int):
+            move = int_move(*move)
+
+        worker_id = move >> 6
+        if not 0 <= worker_id < self.WORKERS_NUMBER:
+            return None
+
+        player_workers = self.worker_cells[self.m_curr_player_index]
+        cell = player_workers[worker_id]
+        walk_cell = NEIGHBOUR_CELLS[cell][(move >> 3) & 0b111]
+        if walk_cell is None or self.heights[walk_cell] > self.heights[cell] + 1 or self.occupied >> walk_cell & 1:
+            return None
+
+        occupied = self.occupied & ~(1 << cell)
+        build_cell = NEIGHBOUR_CELLS[walk_cell][move & 0b111]
+        if build_cell is None or self.heights[build_cell] >= self.MAX_BUILD_HEIGHT or occupied >> build_cell & 1:
+            return None
+
+        heights = self.heights[:]
+        heights[build_cell] += 1
+        worker_cells = list(self.worker_cells)
+        worker_cells[self.m_curr_player_index] = \
+            player_workers[:worker_id] + (walk_cell,) + player_workers[worker_id + 1:]
+
+        # Skip the constructor, everything is already known
+        new_state = object.__new__(SantoriniState)
+        new_state.m_players = self.m_players
+        new_state.m_curr_player_index = self._next_player_index()
+        new_state.m_moves = None
+        new_state.winner = NOT_COMPUTED
+        new_state.last_move = (self.get_curr_player(), *tuple_move(move))
+        new_state.heights = heights
+        new_state.worker_cells = tuple(worker_cells)
+        new_state.occupied = occupied | 1 << walk_cell
+        return new_state
+
+    def to_bytes(self):
+        # Header: player index and the last move (as an int_move()), then the heights as a base-5 number in 8 bytes
+        # and a byte per worker with its cell index
+        last_move = int_move(*self.last_move[1:]) if self.last_move else NO_LAST_MOVE
+
+        heights = 0
+        for height in reversed(self.heights):
+            heights = heights * (self.MAX_BUILD_HEIGHT + 1) + height
+
+        workers = bytes(cell for workers in self.worker_cells for cell in workers)
+        return bytes([self.m_curr_player_index, last_move]) + heights.to_bytes(8, 'little') + workers
+
+    def encode_move(self, move):
+        worker, walk, build = tuple_move(move) if isinstance(move, int) else move
+        return [worker, walk.value, build.value]
+
+    def decode_move(self, data):
+        worker, walk, build = data
+        return int_move(worker, Direction(walk), Direction(build))
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        player_index, last_move = data[0], data[1]
+        if last_move != NO_LAST_MOVE:
+            last_move = (players[(player_index - 1) % len(players)], *tuple_move(last_move))
+        else:
+            last_move = None
+
+        heights = int.from_bytes(data[2:10], 'little')
+        cells = [[0] * COLS for _ in range(ROWS)]
+        for row in range(ROWS):
+            for col in range(COLS):
+                heights, cells[row][col] = divmod(heights, cls.MAX_BUILD_HEIGHT + 1)
+
+        workers = [[divmod(cell, COLS) for cell in data[10 + i:10 + i + cls.WORKERS_NUMBER]]
+                   for i in range(0, len(players) * cls.WORKERS_NUMBER, cls.WORKERS_NUMBER)]
+        return SantoriniState(cells, players, workers, last_move, player_index)
+
     def __eq__(self, other) -> bool:
         return super().__eq__(other) \
-               and self.cells == other.cells \
-               and self.workers == other.workers
+               and self.heights == other.heights \
+               and self.worker_cells == other.worker_cells
 
     def __str__(self):
         ret = ''
+        workers = self.workers
         for row_index, row in enumerate(self.cells):
             for col_index, cell in enumerate(row):
                 curr_worker = '  '
-                for player, workers in zip(self.m_players, self.workers):
-                    if (row_index, col_index) in workers:
+                for player, player_workers in zip(self.m_players, workers):
+                    if (row_index, col_index) in player_workers:
                         curr_worker = player.get_char()
                 ret += f'{curr_worker[0]}{cell}{curr_worker[1]}'
             ret += '\n'
 
-        for i, workers_at_index in enumerate(zip(*self.workers)):
+        for i, workers_at_index in enumerate(zip(*workers)):
             ret += f'\nWorker #{i}:'
             for player, (worker_row, worker_col) in zip(self.m_players, workers_at_index):
                 player_char_1, player_char_2 = player.get_char()
@@ -246,27 +502,26 @@ class SantoriniGame(game.Game):
         return False
 
 
-def main():
+def new_game(players, observers=()):
     board = [[0 for _ in range(COLS)] for _ in range(ROWS)]
     # board[2][2] = 3
     # board[3][3] = 2
 
+    return SantoriniGame(SantoriniState(cells=board,
+                                        players=players,
+                                        workers=[[(1, 1), (ROWS - 2, COLS - 2)],
+                                                 [(1, COLS - 2), (ROWS - 2, 1)]]),
+                         observers)
+
+
+def main():
     player1 = SantoriniAiPlayer(P1_CHAR, iterations=10_000, secs=10)
     # player2 = SantoriniAiPlayer(P2_CHAR, iterations=10_000, secs=10)
-    player2 = SantoriniNetworkPlayer(P2_CHAR, ('84.229.89.76', 9999))
-    santorini_game = SantoriniGame(SantoriniState(cells=board,
-                                                  players=[player1, player2],
-                                                  workers=[[(1, 1), (ROWS - 2, COLS - 2)],
-                                                           [(1, COLS - 2), (ROWS - 2, 1)]]))
-
-    for state in santorini_game.play():
-        print(state)
-
-    winner = santorini_game.get_winner()
-    if winner is not None:
-        print(f'The winner is {winner.get_char()}!')
-    else:
-        print(f'It\'s a tie!')
+    player2 = SantoriniNetworkPlayer(P2_CHAR, (HOST, PORT))
+    santorini_game = new_game([player1, player2], observers=[game.ConsoleObserver()])
+
+    for _state in santorini_game.play():
+        pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,35 @@
+"""
+The frames of santorini_server, shared by its server and clients and by santorini.SantoriniNetworkPlayer.
+Every frame is exactly FRAME_SIZE (8) ASCII bytes, see santorini_server for their formats.
+"""
+FRAME_SIZE = 8
+HOST = '127.0.0.1'
+PORT = 9999
+
+CLIENT_FIRST = 'c'
+SERVER_FIRST = 's'
+
+ERROR_BAD_MOVE = 'badmov'
+ERROR_BAD_FRAME = 'badfrm'
+ERROR_NO_SESSION = 'nosess'
+ERROR_TIMEOUT = 'timout'
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def frame(text) -> bytes:
+    return text.ljust(FRAME_SIZE).encode('ascii')
+
+
+def session_frame(command, session_id, ply) -> bytes:
+    return frame(f'#{command}{session_id:04x}{ply:02x}')
+
+
+def parse_session_frame(data: bytes):
+    """ (session id, ply) of a '#S' or '#R' frame """
+    try:
+        return int(data[2:6], 16), int(data[6:8], 16)
+    except ValueError:
+        raise ProtocolError(f'Bad session frame {data!r}')
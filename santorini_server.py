@@ -0,0 +1,384 @@
+"""
+An asyncio server that hosts many Santorini games against local AI players, and a client for it.
+
+Every frame is exactly FRAME_SIZE (8) ASCII bytes:
+    '0 nw  e '  A move, santorini.move_to_text() padded with a space
+    '#Nc     '  New game, the client moves first ('c') or the server does ('s')
+    '#Sid__pp'  Session: its id (4 hex digits) and the number of moves the server has played in it (2 hex digits)
+    '#Rid__pp'  Resume the session after a reconnect, with the number of moves the client has seen
+    '#Gw     '  Game over, w is the index of the winner
+    '#Ereason'  Error, e.g. '#Ebadmov' for an illegal move (the client may send another one)
+
+After a resume, the side that played more moves sends its last move again.
+
+Example:
+    python santorini_server.py serve --ai "santorini.SantoriniAiPlayer('()', 500)" -j 4
+    python santorini_server.py play --player "santorini.SantoriniMinimaxPlayer('[]', depth=1)" -n 200
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import random
+
+import game
+import santorini
+from arena import PlayerSpec
+from santorini_protocol import (CLIENT_FIRST, ERROR_BAD_FRAME, ERROR_BAD_MOVE, ERROR_NO_SESSION, ERROR_TIMEOUT,
+                                FRAME_SIZE, HOST, PORT, SERVER_FIRST, ProtocolError, frame, parse_session_frame,
+                                session_frame)
+
+MOVE_TIMEOUT = 60  # Seconds the server waits for a client's move
+RESUME_TIMEOUT = 30  # Seconds a disconnected session is kept for its client to resume it
+CONNECT_RETRIES = 5
+RETRY_DELAY = 0.2  # Seconds, doubled on every retry
+
+
+def other_char(char):
+    return santorini.P2_CHAR if char == santorini.P1_CHAR else santorini.P1_CHAR
+
+
+def new_state(local_player, remote_char, local_first):
+    players = [local_player, game.PlaceholderPlayer(remote_char)]
+    return santorini.new_game(players if local_first else players[::-1]).m_state
+
+
+def _ai_move(spec: PlayerSpec, state_data, ai_index):
+    """ Runs in a worker process, the state is passed as bytes and the player is created from its spec """
+    ai_player = spec.create()
+    players = [ai_player, game.PlaceholderPlayer(other_char(ai_player.get_char()))]
+    if ai_index:
+        players.reverse()
+
+    return ai_player.get_move(santorini.SantoriniState.from_bytes(state_data, players))
+
+
+class MatchSession:
+    """ A game of the server against a client, which survives reconnects of the client """
+
+    def __init__(self, server: 'SantoriniServer', session_id, client_first):
+        self.server = server
+        self.session_id = session_id
+        self.ai_index = 1 if client_first else 0
+        ai_char = santorini.P2_CHAR if client_first else santorini.P1_CHAR
+        self.state = new_state(game.PlaceholderPlayer(ai_char), other_char(ai_char), not client_first)
+        self.ply = 0
+        self.last_move_frame = None
+        self.last_move_by_server = False
+        self.game_over_frame = None
+        self.reader = None
+        self.writer = None
+        self.connected = asyncio.Event()
+
+    def attach(self, reader, writer, client_ply):
+        if self.writer is not None:
+            self.writer.close()
+
+        self.reader, self.writer = reader, writer
+        self.writer.write(session_frame('S', self.session_id, self.ply))
+        if self.last_move_by_server and client_ply < self.ply:
+            self.writer.write(self.last_move_frame)  # It was lost with the previous connection
+
+        if self.game_over_frame is not None:
+            self.writer.write(self.game_over_frame)
+            self.detach()
+        else:
+            self.connected.set()
+
+    def detach(self):
+        if self.writer is not None:
+            self.writer.close()
+
+        self.reader = self.writer = None
+        self.connected.clear()
+
+    async def send(self, data):
+        """ Frames that are sent while the client is away are lost, the last move is sent again on resume """
+        if self.writer is None:
+            return
+
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except ConnectionError:
+            self.detach()
+
+    async def receive(self) -> bytes:
+        while True:
+            try:
+                await asyncio.wait_for(self.connected.wait(), self.server.resume_timeout)
+            except asyncio.TimeoutError:
+                raise ProtocolError(f'Session {self.session_id:04x} was not resumed')
+
+            reader = self.reader
+            try:
+                return await asyncio.wait_for(reader.readexactly(FRAME_SIZE), self.server.move_timeout)
+            except asyncio.TimeoutError:
+                await self.send(frame('#E' + ERROR_TIMEOUT))
+                raise ProtocolError(f'Session {self.session_id:04x} timed out')
+            except (asyncio.IncompleteReadError, ConnectionError):
+                if reader is self.reader:  # Unless the client already reconnected
+                    self.detach()
+
+    async def run(self):
+        try:
+            while self.state.get_winner() is None:
+                if self.state.m_curr_player_index == self.ai_index:
+                    move = await self.server.get_ai_move(self.state, self.ai_index)
+                    self.play(move, by_server=True)
+                    await self.send(self.last_move_frame)
+                else:
+                    data = await self.receive()
+                    try:
+                        move = santorini.move_from_text(data.decode('ascii'))
+                    except (ValueError, IndexError):
+                        await self.send(frame('#E' + ERROR_BAD_FRAME))
+                        continue
+
+                    if self.state.move(move) is None:
+                        await self.send(frame('#E' + ERROR_BAD_MOVE))
+                        continue
+
+                    self.play(move, by_server=False)
+
+            winner_index = self.state.m_players.index(self.state.get_winner())
+            self.game_over_frame = frame(f'#G{winner_index}')
+            await self.send(self.game_over_frame)
+            self.server.games_finished += 1
+
+            # Keep the session for a while, in case the client missed the end and resumes
+            asyncio.get_running_loop().call_later(self.server.resume_timeout, self.forget)
+        except ProtocolError:
+            self.server.games_abandoned += 1
+            self.forget()
+        finally:
+            self.detach()
+
+    def forget(self):
+        if self.server.sessions.get(self.session_id) is self:
+            del self.server.sessions[self.session_id]
+
+    def play(self, move, by_server):
+        self.state = self.state.move(move)
+        self.ply += 1
+        self.last_move_frame = santorini.move_frame(move)
+        self.last_move_by_server = by_server
+
+
+class SantoriniServer:
+    def __init__(self, ai_spec: PlayerSpec, host=HOST, port=PORT, processes=None, move_timeout=MOVE_TIMEOUT,
+                 resume_timeout=RESUME_TIMEOUT):
+        self.ai_spec = ai_spec
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.move_timeout = move_timeout
+        self.resume_timeout = resume_timeout
+        self.sessions = {}
+        self.tasks = set()
+        self.next_session_id = 0
+        self.games_finished = 0
+        self.games_abandoned = 0
+        self.pool = None
+        self.server = None
+
+    async def start(self):
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.processes)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # In case port 0 picked a free one
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.pool.shutdown()
+
+    async def get_ai_move(self, state, ai_index):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, _ai_move, self.ai_spec, state.to_bytes(), ai_index)
+
+    def _new_session_id(self):
+        while self.next_session_id in self.sessions:
+            self.next_session_id = (self.next_session_id + 1) % 0x10000
+
+        return self.next_session_id
+
+    async def handle_connection(self, reader, writer):
+        try:
+            data = await asyncio.wait_for(reader.readexactly(FRAME_SIZE), self.move_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        if data.startswith(b'#N') and chr(data[2]) in (CLIENT_FIRST, SERVER_FIRST):
+            session = MatchSession(self, self._new_session_id(), chr(data[2]) == CLIENT_FIRST)
+            self.sessions[session.session_id] = session
+            session.attach(reader, writer, 0)
+            task = asyncio.create_task(session.run())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        elif data.startswith(b'#R'):
+            try:
+                session_id, client_ply = parse_session_frame(data)
+            except ProtocolError:
+                session_id, client_ply = None, 0
+
+            if session_id in self.sessions:
+                self.sessions[session_id].attach(reader, writer, client_ply)
+            else:
+                writer.write(frame('#E' + ERROR_NO_SESSION))
+                writer.close()
+        else:
+            writer.write(frame('#E' + ERROR_BAD_FRAME))
+            writer.close()
+
+
+class SantoriniClient:
+    """ A game against the server, reconnecting and resuming it when the connection breaks """
+
+    def __init__(self, host=HOST, port=PORT, retries=CONNECT_RETRIES, timeout=MOVE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.retries = retries
+        self.timeout = timeout
+        self.session_id = None
+        self.ply = 0
+        self.last_move_frame = None
+        self.reader = None
+        self.writer = None
+        self.reconnects = 0
+
+    async def _connect(self, first_frame):
+        delay = RETRY_DELAY
+        for attempt in range(self.retries + 1):
+            try:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                self.writer.write(first_frame)
+                data = await asyncio.wait_for(self.reader.readexactly(FRAME_SIZE), self.timeout)
+                break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, OSError):
+                if attempt == self.retries:
+                    raise
+
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        if not data.startswith(b'#S'):
+            raise ProtocolError(f'Unexpected reply {data!r}')
+
+        self.session_id, server_ply = parse_session_frame(data)
+        if server_ply < self.ply:
+            self.writer.write(self.last_move_frame)  # The server did not get our last move
+
+    async def start(self, client_first=True):
+        await self._connect(frame(f'#N{CLIENT_FIRST if client_first else SERVER_FIRST}'))
+
+    async def reconnect(self):
+        self.close()
+        self.reconnects += 1
+        await self._connect(session_frame('R', self.session_id, self.ply))
+
+    async def send_move(self, move):
+        self.ply += 1
+        self.last_move_frame = santorini.move_frame(move)
+        try:
+            self.writer.write(self.last_move_frame)
+            await self.writer.drain()
+        except ConnectionError:
+            await self.reconnect()
+
+    async def receive(self) -> bytes:
+        while True:
+            try:
+                return await asyncio.wait_for(self.reader.readexactly(FRAME_SIZE), self.timeout)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await self.reconnect()
+
+    async def receive_move(self):
+        """ The server's move, or None if the game is over """
+        while True:
+            data = await self.receive()
+            if data.startswith(b'#G'):
+                return None
+            if data.startswith(b'#E'):
+                raise ProtocolError(f'Server error {data[2:].decode("ascii").strip()}')
+
+            self.ply += 1
+            return santorini.move_from_text(data.decode('ascii'))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def play_remote_game(player: game.Player, host=HOST, port=PORT, client_first=True):
+    """ Play a local player against the server, returns the final state """
+    client = SantoriniClient(host, port)
+    await client.start(client_first)
+    state = new_state(player, other_char(player.get_char()), client_first)
+    loop = asyncio.get_running_loop()
+    try:
+        while state.get_winner() is None:
+            if state.get_curr_player() is player:
+                move = await loop.run_in_executor(None, player.get_move, state)
+                state = state.move(move)
+                await client.send_move(move)
+            else:
+                move = await client.receive_move()
+                if move is None:
+                    break
+
+                state = state.move(move)
+
+        if client.ply and state.get_winner() is not None:
+            await client.receive_move()  # Wait for the server to agree on the end of the game
+    finally:
+        client.close()
+
+    return state
+
+
+async def play_remote_games(player_spec: PlayerSpec, games, host=HOST, port=PORT):
+    async def play_one(index):
+        player = player_spec.create()
+        state = await play_remote_game(player, host, port, client_first=index % 2 == 0)
+        return state.get_winner() is player
+
+    results = await asyncio.gather(*(play_one(index) for index in range(games)), return_exceptions=True)
+    wins = sum(1 for result in results if result is True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    print(f'Games: {games}, wins: {wins}, losses: {games - wins - len(errors)}, errors: {len(errors)}')
+    for error in errors[:5]:
+        print(f'\t{error!r}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host Santorini games against local AI players.')
+    parser.add_argument('command', choices=['serve', 'play'])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--ai', default=f"santorini.SantoriniAiPlayer('{santorini.P1_CHAR}', 500)",
+                        help='serve: the AI player of the server, as a call')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='serve: AI worker processes')
+    parser.add_argument('--player', default=f"santorini.SantoriniMinimaxPlayer('{santorini.P2_CHAR}', depth=1)",
+                        help='play: the local player, as a call')
+    parser.add_argument('-n', '--games', type=int, default=1, help='play: concurrent games')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.command == 'serve':
+        server = SantoriniServer(PlayerSpec.parse(args.ai), args.host, args.port, args.processes)
+        asyncio.run(server.serve_forever())
+    else:
+        asyncio.run(play_remote_games(PlayerSpec.parse(args.player), args.games, args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import DividersGame
+import game
+
+
+def wins(state, results):
+    """ If the player to move wins, searched without removing the isolated pairs, memoized in results by mask """
+    if state.mask not in results:
+        # Taking the last number wins, so the player to move on an empty board has lost
+        results[state.mask] = any(not wins(state.move(move), results) for move in state.get_moves())
+
+    return results[state.mask]
+
+
+def test_solver_matches_plain_search():
+    players = [game.PlaceholderPlayer(DividersGame.HUMAN_CHAR), game.PlaceholderPlayer(DividersGame.AI_CHAR)]
+    for max_number in range(1, 21):
+        results = {}
+        pending = [DividersGame.new_game(players, max_number=max_number).m_state]
+        seen = set()
+        while pending:
+            state = pending.pop()
+            if state.mask in seen:
+                continue
+
+            seen.add(state.mask)
+            result, _plies = state.get_solution()
+            assert result == (game.SOLVED_WIN if wins(state, results) else game.SOLVED_LOSS)
+            if state.mask:
+                best_move, = state.get_best_moves()
+                assert wins(state.move(best_move), results) != wins(state, results)
+                pending.extend(state.move(move) for move in state.get_moves())
@@ -0,0 +1,14 @@
+import analysis
+import four_in_a_row
+import game
+
+
+def test_stats_are_of_the_reported_move():
+    players = [game.PlaceholderPlayer(four_in_a_row.HUMAN_CHAR), game.PlaceholderPlayer(four_in_a_row.AI_CHAR)]
+    state = four_in_a_row.new_game(players).m_state.move(3)
+    for args in analysis._encode_states([state], False, {'iterations': 30}, analysis.PV_LENGTH):
+        result = analysis._analyse(args)
+        assert result.pv[0] == result.move
+        assert result.stats['score'] == result.score
+        assert result.stats['visits'] > 0
+        assert result.stats['iterations'] == 30
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import four_in_a_row  # noqa: E402
+import four_in_a_row_batch  # noqa: E402
+import game  # noqa: E402
+import huge_tic_tac_toe  # noqa: E402
+import huge_tic_tac_toe_batch  # noqa: E402
+import tic_tac_toe  # noqa: E402
+import tic_tac_toe_batch  # noqa: E402
+
+GAMES = [
+    (tic_tac_toe, tic_tac_toe_batch.TicTacBatchState),
+    (huge_tic_tac_toe, huge_tic_tac_toe_batch.HugeTicTacBatchState),
+    (four_in_a_row, four_in_a_row_batch.FourInRowBatchState),
+]
+
+
+def new_state(module):
+    players = [game.PlaceholderPlayer(module.AI_CHAR), game.PlaceholderPlayer(module.HUMAN_CHAR)]
+    return module.new_game(players).m_state
+
+
+@pytest.mark.parametrize('module, batch_class', GAMES)
+def test_batch_plays_like_the_states(module, batch_class):
+    """ Random games played in lockstep in a batch and one by one as states """
+    rng = random.Random(0)
+    states = [new_state(module)] * 50
+    batch = batch_class.from_states(states)
+    players = states[0].m_players
+    while not batch.terminal().all():
+        legal = batch.legal_moves()
+        moves = np.zeros(len(states), dtype=np.intp)
+        for index, state in enumerate(states):
+            over = state.get_winner() is not None or state.no_moves()
+            assert batch.terminal()[index] == over
+            if not over:
+                state_moves = sorted(state.get_moves())
+                assert list(np.flatnonzero(legal[index])) == state_moves
+                moves[index] = rng.choice(state_moves)
+                states[index] = state.move(int(moves[index]))
+
+        batch.apply_moves(moves)
+
+    for index, state in enumerate(states):
+        winner = state.get_winner()
+        assert batch.winners()[index] == (-1 if winner is None else players.index(winner))
+        assert batch.get_state(index, players) == state
+
+
+@pytest.mark.parametrize('module, batch_class', GAMES)
+def test_play_random_finishes_every_game(module, batch_class):
+    """ From states of both players to move, and some finished ones """
+    rng = random.Random(0)
+    states = []
+    state = new_state(module)
+    while state.get_winner() is None and not state.no_moves():
+        states.extend([state] * 20)
+        state = state.move(rng.choice(list(state.get_moves())))
+    states.append(state)
+
+    batch = batch_class.from_states(states)
+    winners = batch.play_random(np.random.default_rng(0))
+    assert batch.terminal().all()
+    players = states[0].m_players
+    for index in range(len(batch)):
+        state = batch.get_state(index, players)
+        winner = state.get_winner()
+        assert winners[index] == (-1 if winner is None else players.index(winner))
@@ -0,0 +1,91 @@
+import pytest
+
+import carlo_monte
+import four_in_a_row
+
+
+def new_players(iterations):
+    return [carlo_monte.CarloMonteCharPlayer(four_in_a_row.AI_CHAR, iterations),
+            carlo_monte.CarloMonteCharPlayer(four_in_a_row.HUMAN_CHAR, iterations)]
+
+
+def test_loaded_tree_keeps_searching(tmp_path):
+    players = new_players(300)
+    state = four_in_a_row.new_game(players).m_state
+    root = carlo_monte.CarloMonteTreeNode(state, player=players[0])
+    root.calc_best_move(300)
+    path = tmp_path / 'tree.mcts'
+    carlo_monte.save_tree(root, path)
+
+    players = new_players(300)
+    state = four_in_a_row.new_game(players).m_state
+    players[0].load_tree(path, state)
+    players[0].get_move(state)
+
+    stats = players[0].get_search_stats()
+    assert stats['iterations'] == 300
+    assert stats['reused_visits'] >= 300
+
+
+def tree_statistics(node):
+    return {node.move: (node.visits, node.total, tree_statistics(node) if node.childs else None)
+            for node in node.childs}
+
+
+def test_loaded_tree_matches_moves_across_options(tmp_path):
+    biased = carlo_monte.CarloMonteCharPlayer(four_in_a_row.AI_CHAR, progressive_bias=1.0)
+    players = [biased, carlo_monte.CarloMonteCharPlayer(four_in_a_row.HUMAN_CHAR)]
+    state = four_in_a_row.new_game(players).m_state.move(0).move(3)
+    root = carlo_monte.CarloMonteTreeNode(state, player=biased)
+    root.calc_best_move(500)
+    path = tmp_path / 'tree.mcts'
+    carlo_monte.save_tree(root, path)
+
+    plain = carlo_monte.CarloMonteCharPlayer(four_in_a_row.AI_CHAR)
+    plain.load_tree(path, state)
+    assert [child.move for child in plain.root.childs] != [child.move for child in root.childs]
+    assert tree_statistics(plain.root) == tree_statistics(root)
+
+
+def test_module_load_tree_loads_a_symmetric_tree(tmp_path):
+    symmetric = carlo_monte.CarloMonteCharPlayer(four_in_a_row.AI_CHAR, symmetry=True, progressive_bias=1.0)
+    players = [symmetric, carlo_monte.CarloMonteCharPlayer(four_in_a_row.HUMAN_CHAR)]
+    state = four_in_a_row.new_game(players).m_state
+    root = carlo_monte.CarloMonteTreeNode(state, player=symmetric)
+    root.calc_best_move(500)
+    path = tmp_path / 'tree.mcts'
+    carlo_monte.save_tree(root, path)
+
+    # The mirrored columns were left out of the saved tree
+    loaded = carlo_monte.load_tree(path, state)
+    assert len(loaded.childs) == 4
+    assert tree_statistics(loaded) == tree_statistics(root)
+
+
+def test_loading_a_mismatching_tree_fails(tmp_path):
+    players = new_players(300)
+    state = four_in_a_row.new_game(players).m_state
+    root = carlo_monte.CarloMonteTreeNode(state, player=players[0])
+    root.calc_best_move(300)
+    path = tmp_path / 'tree.mcts'
+    carlo_monte.save_tree(root, path)
+
+    for _ in range(6):
+        state = state.move(0)  # Fill up the first column
+    with pytest.raises(ValueError):
+        carlo_monte.load_tree(path, state)
+
+
+def test_symmetric_reply_reuses_the_tree():
+    symmetric = carlo_monte.CarloMonteCharPlayer(four_in_a_row.AI_CHAR, 300, symmetry=True)
+    players = [carlo_monte.CarloMonteCharPlayer(four_in_a_row.HUMAN_CHAR), symmetric]
+    state = four_in_a_row.new_game(players).m_state
+    symmetric.root = carlo_monte.CarloMonteTreeNode(state, max_player=False, player=symmetric)
+    symmetric.root.calc_best_move(300)
+    assert sorted(child.move for child in symmetric.root.childs) == [0, 1, 2, 3]
+
+    # Column 5 was left out for its mirror, column 1
+    state = state.move(5)
+    move = symmetric.get_move(state)
+    assert symmetric.reused_visits > 0
+    assert state.move(move).canonical_key() == symmetric.root.state.canonical_key()
@@ -0,0 +1,58 @@
+import asyncio
+import base64
+import threading
+
+import pytest
+
+import engine_service
+import four_in_a_row
+import game
+
+
+@pytest.fixture
+def service_address():
+    service = engine_service.EngineService(processes=1)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def serve():
+        await service.start(tcp=('127.0.0.1', 0))
+        started.set()
+
+    thread = threading.Thread(target=lambda: (loop.run_until_complete(serve()), loop.run_forever()), daemon=True)
+    thread.start()
+    assert started.wait(30)
+    host, port = service.server.sockets[0].getsockname()[:2]
+    yield f'{host}:{port}'
+
+    asyncio.run_coroutine_threadsafe(service.close(), loop).result(30)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(30)
+
+
+def test_session_round_trip(service_address):
+    client = engine_service.EngineClient(service_address)
+    players = [game.PlaceholderPlayer(four_in_a_row.HUMAN_CHAR), game.PlaceholderPlayer(four_in_a_row.AI_CHAR)]
+    state = four_in_a_row.new_game(players).m_state
+    try:
+        move = client.best_move('four_in_a_row', state, session='game-1', iterations=50)
+        assert move in state.get_moves()
+        state = state.move(move).move(0)
+
+        # The session's player is kept, with the budget of each request
+        response = client.request(game='four_in_a_row', chars=['O', 'X'], session='game-1', iterations=120,
+                                  state=base64.b64encode(state.to_bytes()).decode('ascii'))
+        assert response['stats']['iterations'] == 120
+        assert response['stats']['reused_visits'] > 0
+
+        stats = client.request(type='stats')
+        assert stats['sessions'] == 1
+        assert stats['requests'] == 3
+        assert stats['errors'] == 0
+        assert stats['latency_ms']['max'] is not None
+
+        client.request(type='end', session='game-1')
+        assert client.request(type='stats')['sessions'] == 0
+        assert 'error' in client.request(game='no_such_game', chars=['O', 'X'], state='')
+    finally:
+        client.close()
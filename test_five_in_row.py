@@ -0,0 +1,25 @@
+import random
+
+import five_in_row
+import game
+
+
+def random_positions(rng, rows, cols, radius, plies):
+    players = [game.PlaceholderPlayer(five_in_row.AI_CHAR), game.PlaceholderPlayer(five_in_row.HUMAN_CHAR)]
+    state = five_in_row.new_game(players, rows=rows, cols=cols, radius=radius).m_state
+    for _ in range(plies):
+        if state.get_winner() is not None or state.no_moves():
+            return
+
+        state = state.move(rng.choice(list(state.get_moves())))
+        yield state
+
+
+def test_bytes_round_trip_keeps_the_radius():
+    rng = random.Random(0)
+    for radius in (1, 2, 3):
+        for state in random_positions(rng, 15, 15, radius, 40):
+            decoded = five_in_row.FiveInRowState.from_bytes(state.to_bytes(), state.m_players)
+            assert decoded == state
+            assert decoded.radius == radius
+            assert sorted(decoded.get_moves()) == sorted(state.get_moves())
@@ -0,0 +1,40 @@
+import random
+
+import four_in_a_row
+import game
+
+
+def random_games(games, seed=0):
+    """ (start state, moves) of random games, with the AI moving first and second """
+    rng = random.Random(seed)
+    for index in range(games):
+        players = [game.PlaceholderPlayer(four_in_a_row.AI_CHAR), game.PlaceholderPlayer(four_in_a_row.HUMAN_CHAR)]
+        state = start_state = four_in_a_row.new_game(players[::-1] if index % 2 else players).m_state
+        moves = []
+        while state.get_winner() is None and not state.no_moves():
+            moves.append(rng.choice(list(state.get_moves())))
+            state = state.move(moves[-1])
+
+        yield start_state, moves
+
+
+def test_bitboard_plays_and_evaluates_like_the_cells():
+    for state, moves in random_games(40):
+        bit_state = four_in_a_row.FourInRowBitState.from_state(state)
+        for move in moves:
+            state, bit_state = state.move(move), bit_state.move(move)
+            assert bit_state.cells == state.cells
+            assert bit_state.eval() == state.eval()
+            assert bit_state.get_winner() is state.get_winner()
+            assert list(bit_state.get_moves()) == list(state.get_moves())
+
+
+def test_incremental_window_counts_match_a_recount():
+    for state, moves in random_games(40, seed=1):
+        for move in moves:
+            state = state.move(move)
+            assert (state.window_counts, state.window_score) == state._count_windows()
+
+            # A decoded state counts its windows from scratch
+            decoded = four_in_a_row.FourInRowState.from_bytes(state.to_bytes(), state.m_players)
+            assert decoded.eval() == state.eval()
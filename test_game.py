@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+import DividersGame
+import five_in_row
+import four_in_a_row
+import game
+import huge_tic_tac_toe
+import santorini
+import tic_tac_toe
+
+
+GAMES = {
+    'tic_tac_toe': (tic_tac_toe.HUMAN_CHAR, tic_tac_toe.AI_CHAR, lambda players: tic_tac_toe.new_game(players)),
+    'huge_tic_tac_toe': (huge_tic_tac_toe.HUMAN_CHAR, huge_tic_tac_toe.AI_CHAR,
+                         lambda players: huge_tic_tac_toe.new_game(players)),
+    'four_in_a_row': (four_in_a_row.HUMAN_CHAR, four_in_a_row.AI_CHAR, lambda players: four_in_a_row.new_game(players)),
+    'four_in_a_row_bitboard': (four_in_a_row.HUMAN_CHAR, four_in_a_row.AI_CHAR,
+                               lambda players: four_in_a_row.new_game(players, bitboard=True)),
+    'five_in_row': (five_in_row.HUMAN_CHAR, five_in_row.AI_CHAR,
+                    lambda players: five_in_row.new_game(players, rows=9, cols=9)),
+    'santorini': (santorini.P1_CHAR, santorini.P2_CHAR, lambda players: santorini.new_game(players)),
+    'dividers': (DividersGame.HUMAN_CHAR, DividersGame.AI_CHAR,
+                 lambda players: DividersGame.new_game(players, max_number=30)),
+}
+
+
+def random_game(state, rng):
+    """ The states of a random game, from the start state to the end """
+    while True:
+        yield state
+        moves = list(state.get_moves())
+        if state.get_winner() is not None or not moves:
+            return
+
+        state = state.move(rng.choice(moves))
+
+
+@pytest.mark.parametrize('game_name', GAMES)
+def test_bytes_round_trip(game_name):
+    first_char, second_char, new_game = GAMES[game_name]
+    rng = random.Random(0)
+    players = [game.PlaceholderPlayer(first_char), game.PlaceholderPlayer(second_char)]
+    for _ in range(5):
+        for state in random_game(new_game(players).m_state, rng):
+            decoded = type(state).from_bytes(state.to_bytes(), players)
+            assert type(decoded) is type(state)
+            assert decoded == state
+            assert decoded.to_bytes() == state.to_bytes()
+            assert decoded.get_winner() is state.get_winner()
+            assert sorted(decoded.get_moves()) == sorted(state.get_moves())
@@ -0,0 +1,26 @@
+import asyncio
+
+import santorini
+import santorini_server
+from arena import PlayerSpec
+
+
+async def play_against_server(client_first):
+    ai_spec = PlayerSpec.parse(f"santorini.SantoriniMinimaxPlayer('{santorini.P1_CHAR}', depth=1)")
+    server = santorini_server.SantoriniServer(ai_spec, port=0, processes=1, move_timeout=30, resume_timeout=1)
+    await server.start()
+    try:
+        player = santorini.SantoriniMinimaxPlayer(santorini.P2_CHAR, depth=1)
+        state = await santorini_server.play_remote_game(player, port=server.port, client_first=client_first)
+    finally:
+        await server.close()
+
+    return server, state
+
+
+def test_ai_plays_ai_through_the_server():
+    for client_first in (True, False):
+        server, state = asyncio.run(play_against_server(client_first))
+        assert state.get_winner() is not None
+        assert server.games_finished == 1
+        assert server.games_abandoned == 0
@@ -0,0 +1,46 @@
+import game
+import tic_tac_toe
+
+
+def brute_force(state, solutions):
+    """ (result, plies, best moves) for the player to move, searched without the table or the symmetries """
+    key = tuple(state.m_cells), state.m_curr_player_index
+    if key not in solutions:
+        winner = state.get_winner()
+        moves = list(state.get_moves())
+        if winner is not None:
+            solutions[key] = game.SOLVED_WIN if winner is state.get_curr_player() else game.SOLVED_LOSS, 0, set()
+        elif not moves:
+            solutions[key] = game.SOLVED_DRAW, 0, set()
+        else:
+            childs = {}
+            for move in moves:
+                result, plies, _moves = brute_force(state.move(move), solutions)
+                childs[move] = -result, plies + 1
+
+            # The best result, then the fastest win or the slowest loss
+            result, plies = max(childs.values(), key=lambda child: (child[0], -child[1] if child[0] > 0 else child[1]))
+            solutions[key] = result, plies, {move for move, child in childs.items() if child == (result, plies)}
+
+    return solutions[key]
+
+
+def test_table_matches_brute_force():
+    players = [game.PlaceholderPlayer(tic_tac_toe.HUMAN_CHAR), game.PlaceholderPlayer(tic_tac_toe.AI_CHAR)]
+    solutions = {}
+    pending = [tic_tac_toe.new_game(players).m_state]
+    seen = set()
+    while pending:
+        state = pending.pop()
+        key = tuple(state.m_cells)
+        if key in seen:
+            continue
+
+        seen.add(key)
+        result, plies, moves = brute_force(state, solutions)
+        assert state.get_solution() == (result, plies)
+        if state.get_winner() is None:
+            assert set(state.get_best_moves()) == moves
+            pending.extend(state.move(move) for move in state.get_moves())
+
+    assert len(seen) == 5478  # Every reachable position
@@ -1,4 +1,4 @@
-from copy import deepcopy
+import random
 
 import carlo_monte
 import game
@@ -34,29 +34,104 @@ class TicTacHumanPlayer(game.Player):
 
 
 class TicTacAiPlayer(carlo_monte.CarloMontePlayer):
+    def __init__(self, char, iterations=2000):
+        super().__init__(iterations)
+        self.m_char = char
+
+    def get_char(self):
+        return self.m_char
+
+
+class TicTacSolverPlayer(game.Player):
+    """ Plays perfectly from the solved table: wins as fast as possible and loses as late as possible """
+
     def __init__(self, char):
-        super().__init__()  # 9)
         self.m_char = char
+        self.last_solution = None
 
     def get_char(self):
         return self.m_char
 
+    def get_move(self, state):
+        self.last_solution = state.get_solution()
+        return random.choice(state.get_best_moves())
+
+    def get_search_stats(self):
+        if self.last_solution is None:
+            return None
+
+        result, plies = self.last_solution
+        return {'result': result, 'plies': plies}
+
+
+WIN_LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
+             (0, 3, 6), (1, 4, 7), (2, 5, 8),
+             (0, 4, 8), (2, 4, 6)]
+
+SYMMETRIES = game.board_symmetries(3, 3)
+
+# (canonical cell codes, player index) -> (result for the player to move, plies until the end, best moves), the moves
+# are in the orientation of the canonical codes. A cell code is 0 for an empty cell and (index + 1) for the cells of
+# the player with that index
+SOLUTIONS = {}
+
+
+def canonical_codes(codes: tuple) -> (tuple, game.BoardSymmetry):
+    """ The smallest of the cell codes as seen through the symmetries of the board, and that symmetry """
+    codes, index = min((symmetry.permute(codes), index) for index, symmetry in enumerate(SYMMETRIES))
+    return codes, SYMMETRIES[index]
+
+
+def solve(codes: tuple, player_index: int):
+    """ Solve the position and all the positions reachable from it, memoized in SOLUTIONS up to symmetry """
+    canonical, symmetry = canonical_codes(codes)
+    key = (canonical, player_index)
+    solution = SOLUTIONS.get(key)
+    if solution is None:
+        solution = SOLUTIONS[key] = _solve_canonical(canonical, player_index)
+
+    result, plies, moves = solution
+    return result, plies, tuple(symmetry.source[move] for move in moves)
+
+
+def _solve_canonical(codes: tuple, player_index: int):
+    winner_code = next((codes[a] for a, b, c in WIN_LINES if codes[a] and codes[a] == codes[b] == codes[c]), 0)
+    if winner_code:
+        return game.SOLVED_WIN if winner_code == player_index + 1 else game.SOLVED_LOSS, 0, ()
+    if 0 not in codes:
+        return game.SOLVED_DRAW, 0, ()
+
+    child_results = {}
+    for move in (i for i, code in enumerate(codes) if not code):
+        child_codes = codes[:move] + (player_index + 1,) + codes[move + 1:]
+        child_result, child_plies = solve(child_codes, 1 - player_index)[:2]
+        child_results[move] = (-child_result, child_plies + 1)
+
+    # Prefer the best result, then the fastest win or the slowest loss
+    def rank(result_plies):
+        result, plies = result_plies
+        return result, -plies if result == game.SOLVED_WIN else plies
+
+    result, plies = max(child_results.values(), key=rank)
+    return result, plies, tuple(move for move, child in child_results.items() if child == (result, plies))
+
+
+solve((0,) * 9, 0)  # Every position reachable from the empty board
+
 
 class TicTacState(game.GameState):
+    EVAL_CHAR = AI_CHAR
+
     def __init__(self, cells, players, last_move=None, player_index=0):
         super().__init__(players, player_index)
         self.m_last_move = last_move
         self.m_cells = cells
 
-    def notify_move(self):
-        print(f'Player {self.m_last_move[0].get_char()} played at cell {self.m_last_move[1] + 1}.')
+    def describe_move(self):
+        return f'Player {self.m_last_move[0].get_char()} played at cell {self.m_last_move[1] + 1}.'
 
     def get_winner(self):
-        sets = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
-                (0, 3, 6), (1, 4, 7), (2, 5, 8),
-                (0, 4, 8), (2, 4, 6)]
-
-        for a, b, c in sets:
+        for a, b, c in WIN_LINES:
             if self.m_cells[a] != ' ' and self.m_cells[a] == self.m_cells[b] and self.m_cells[a] == self.m_cells[c]:
                 return next((p for p in self.m_players if p.get_char() == self.m_cells[a]), None)
 
@@ -70,16 +145,56 @@ class TicTacState(game.GameState):
 
         return minimax.INF if winner.get_char() == AI_CHAR else -minimax.INF
 
+    def _codes(self):
+        codes = self._char_codes()
+        return tuple(codes[c] for c in self.m_cells)
+
+    def _solve(self):
+        return solve(self._codes(), self.m_curr_player_index)
+
+    def get_solution(self):
+        return self._solve()[:2]
+
+    def get_best_moves(self):
+        """ The moves that keep the perfect play result """
+        return self._solve()[2]
+
+    def canonical_key(self):
+        return canonical_codes(self._codes())[0], self.m_curr_player_index
+
+    def canonical_move(self, move):
+        return canonical_codes(self._codes())[1].cell_map[move]
+
+    def from_canonical_move(self, move):
+        return canonical_codes(self._codes())[1].source[move]
+
     def get_moves(self):
         return (i for i, cell in enumerate(self.m_cells) if cell == ' ')
 
     def move(self, move: int):
         if move in range(len(self.m_cells)) and self.m_cells[move] == ' ':
-            new_cells = deepcopy(self.m_cells)
+            new_cells = self.m_cells[:]
             new_cells[move] = self.get_curr_player().get_char()
             last_move = (self.get_curr_player(), move)
             return TicTacState(new_cells, self.m_players, last_move, self._next_player_index())
 
+    def to_bytes(self):
+        # Header: player index (2 bits) and the last move cell + 1 (4 bits), then 2 bits per cell
+        last_cell = self.m_last_move[1] + 1 if self.m_last_move else 0
+        codes = self._char_codes()
+        return bytes([self.m_curr_player_index | last_cell << 2]) + game.pack_2bit(codes[c] for c in self.m_cells)
+
+    @classmethod
+    def from_bytes(cls, data, players):
+        player_index, last_cell = data[0] & 0b11, data[0] >> 2
+        chars = cls._code_chars(players)
+        cells = [chars[code] for code in game.unpack_2bit(data[1:], 9)]
+        last_move = (players[(player_index - 1) % len(players)], last_cell - 1) if last_cell else None
+        return TicTacState(cells, players, last_move, player_index)
+
+    def __eq__(self, other) -> bool:
+        return super().__eq__(other) and self.m_cells == other.m_cells
+
     def __str__(self):
         ret = ''
         for i, cell in enumerate(self.m_cells):
@@ -93,24 +208,21 @@ class TicTacState(game.GameState):
         return ret + '\n'
 
 
-def main():
+def new_game(players, observers=()):
     board = [' ', ' ', ' ',  # 0 1 2
              ' ', ' ', ' ',  # 3 4 5
              ' ', ' ', ' ']  # 6 7 8
 
-    human_player = TicTacHumanPlayer(HUMAN_CHAR)
-    ai_player = TicTacAiPlayer(AI_CHAR)
-    tictac_game = game.Game(TicTacState(board, [human_player, ai_player]))
+    return game.Game(TicTacState(board, players), observers)
 
-    for state in tictac_game.play():
-        print(state)
 
-    winner = tictac_game.get_winner()
-    if winner is not None:
-        print(f'The winner is {winner.get_char()}!')
-    else:
-        print(f'It\'s a tie!')
+def main():
+    human_player = TicTacHumanPlayer(HUMAN_CHAR)
+    ai_player = TicTacAiPlayer(AI_CHAR)
+    tictac_game = new_game([human_player, ai_player], observers=[game.ConsoleObserver()])
 
+    for _state in tictac_game.play():
+        pass
 
 
 if __name__ == '__main__':
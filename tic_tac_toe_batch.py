@@ -0,0 +1,74 @@
+"""
+Tic tac toe games in a batch (game.BatchGameState), a 9 bit mask per player and game.
+
+Needs numpy.
+"""
+import numpy as np
+
+import game
+from tic_tac_toe import TicTacState, WIN_LINES
+
+CELL_BITS = 1 << np.arange(9, dtype=np.uint16)
+FULL_BOARD = 0b111111111
+# By a 9 bit mask of a player's cells
+IS_WIN = np.array([any(all(mask >> i & 1 for i in line) for line in WIN_LINES) for mask in range(1 << 9)])
+
+
+class TicTacBatchState(game.BatchGameState):
+    move_count = 9
+
+    def __init__(self, boards, player_indexes, winners=None):
+        """ boards - a (games, 2) array of the cells masks of each player """
+        self.boards = boards
+        self.player_indexes = player_indexes
+        self.winner_indexes = winners if winners is not None else \
+            np.where(IS_WIN[boards[:, 0]], 0, np.where(IS_WIN[boards[:, 1]], 1, -1)).astype(np.int8)
+        self.ply_counts = np.zeros(len(boards), dtype=np.int32)
+
+    @classmethod
+    def from_states(cls, states):
+        chars = [player.get_char() for player in states[0].m_players]
+        assert len(chars) == 2, 'The batch is of two players games'
+        boards = np.array([[sum(1 << i for i, cell in enumerate(state.m_cells) if cell == char) for char in chars]
+                           for state in states], dtype=np.uint16)
+        return cls(boards, np.array([state.m_curr_player_index for state in states], dtype=np.int8))
+
+    @classmethod
+    def new(cls, count):
+        """ count games from the empty board """
+        return cls(np.zeros((count, 2), dtype=np.uint16), np.zeros(count, dtype=np.int8))
+
+    def __len__(self):
+        return len(self.boards)
+
+    def current_players(self):
+        return self.player_indexes
+
+    def legal_moves(self):
+        occupied = self.boards[:, 0] | self.boards[:, 1]
+        return ((occupied[:, None] & CELL_BITS) == 0) & ~self.terminal()[:, None]
+
+    def apply_moves(self, moves):
+        games = np.flatnonzero(~self.terminal())
+        players = self.player_indexes[games]
+        boards = self.boards[games, players] | CELL_BITS[np.asarray(moves)[games]]
+        self.boards[games, players] = boards
+
+        self.winner_indexes[games] = np.where(IS_WIN[boards], players, -1)
+        self.player_indexes[games] = 1 - players
+        self.ply_counts[games] += 1
+
+    def winners(self):
+        return self.winner_indexes
+
+    def terminal(self):
+        return (self.winner_indexes >= 0) | ((self.boards[:, 0] | self.boards[:, 1]) == FULL_BOARD)
+
+    def plies(self):
+        return self.ply_counts
+
+    def get_state(self, index, players):
+        chars = [player.get_char() for player in players]
+        cells = [next((char for char, board in zip(chars, self.boards[index]) if board >> i & 1), ' ')
+                 for i in range(9)]
+        return TicTacState(cells, players, player_index=int(self.player_indexes[index]))
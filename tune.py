@@ -0,0 +1,118 @@
+"""
+Tune the search constants of the Monte Carlo player of a game by self-play, with successive halving.
+
+Random settings around the defaults each play a match against the default settings over the arena's process pool.
+After every round the better half of the settings goes on to the next one, which plays twice the games.
+Both players get the same time per move, so the best settings are the strongest per CPU-second (as long as there are
+no more processes than cores).
+
+Example:
+    python tune.py four_in_a_row --ms 100 --candidates 16 -n 8 -j 8
+"""
+import argparse
+import importlib
+import math
+import random
+
+import arena
+import carlo_monte
+
+PLAYER_PATH = 'carlo_monte.CarloMonteCharPlayer'
+
+# The tuned keyword arguments of CarloMontePlayer: (default, lowest, highest), sampled log-uniformly.
+# All the scores scale with win_score, so only win_score / score_scale matters (besides the depth of the wins), and
+# win_score is left at its default.
+PARAMETERS = {
+    'search_const': (carlo_monte.SEARCH_CONST, 0.25, 8),
+    'score_scale': (carlo_monte.SCORE_SCALE, 250, 4000),
+}
+
+
+class Candidate:
+    def __init__(self, params):
+        self.params = params
+        self.stats = arena.ArenaStats()
+
+    def spec(self, char, ms):
+        return arena.PlayerSpec(PLAYER_PATH, char, secs=ms / 1000, **self.params)
+
+    def __str__(self):
+        low, high = self.stats.confidence_interval()
+        params = ', '.join(f'{name}={value:g}' for name, value in self.params.items())
+        return f'{params} | {self.stats.games} games, score {self.stats.score():.3f} [{low:.3f}, {high:.3f}], ' \
+               f'Elo {self.stats.score_to_elo(self.stats.score()):+.0f}'
+
+
+def sample_params(parameters, rng: random.Random):
+    params = {}
+    for name, (default, low, high) in parameters.items():
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        params[name] = round(value, 3) if isinstance(default, float) or value < 10 else round(value)
+
+    return params
+
+
+def game_chars(game_module_name):
+    """ The chars of the players of a game, by its module's conventions """
+    game_module = importlib.import_module(game_module_name)
+    for first, second in (('AI_CHAR', 'HUMAN_CHAR'), ('P1_CHAR', 'P2_CHAR')):
+        if hasattr(game_module, first) and hasattr(game_module, second):
+            return getattr(game_module, first), getattr(game_module, second)
+
+    return 'X', 'O'
+
+
+def play_round(game_module_name, candidates, baseline: Candidate, games, ms, chars, processes=None, seed=None):
+    """ Every candidate plays games against the baseline, half of them first, all over one process pool """
+    baseline_spec = baseline.spec(chars[1], ms)
+    games_args = [(game_module_name, candidate.spec(chars[0], ms), baseline_spec,
+                   candidate_index * games + index, index % 2 == 0, seed)
+                  for candidate_index, candidate in enumerate(candidates)
+                  for index in range(games)]
+    for result in arena.play_games(games_args, processes):
+        candidates[result.index // games].stats.add(result)
+
+
+def successive_halving(game_module_name, candidates, games, ms, chars, processes=None, seed=None, log=print):
+    """ Returns the surviving candidate, the candidates keep the statistics of all their games """
+    baseline = Candidate({name: default for name, (default, _low, _high) in PARAMETERS.items()})
+    round_number = 0
+    while True:
+        round_number += 1
+        log(f'Round {round_number}: {len(candidates)} candidates, {games} games each')
+        play_round(game_module_name, candidates, baseline, games, ms, chars, processes,
+                   None if seed is None else seed + round_number * 1_000_000)
+
+        candidates = sorted(candidates, key=lambda candidate: candidate.stats.score(), reverse=True)
+        for candidate in candidates:
+            log(f'\t{candidate}')
+
+        candidates = candidates[:(len(candidates) + 1) // 2]
+        if len(candidates) == 1:
+            return candidates[0]
+
+        games *= 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune the Monte Carlo search constants of a game by self-play.')
+    parser.add_argument('game', help='The game module, e.g. four_in_a_row')
+    parser.add_argument('--ms', type=int, default=100, help='The time per move of both players')
+    parser.add_argument('--candidates', type=int, default=16, help='The number of random settings')
+    parser.add_argument('-n', '--games', type=int, default=8, help='The games of each candidate in the first round')
+    parser.add_argument('-j', '--processes', type=int, default=None)
+    parser.add_argument('--chars', nargs=2, default=None, help='The chars of the players (default: by the game)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    defaults = {name: default for name, (default, _low, _high) in PARAMETERS.items()}
+    candidates = [Candidate(defaults)] + [Candidate(sample_params(PARAMETERS, rng)) for _ in range(args.candidates)]
+    chars = args.chars or game_chars(args.game)
+
+    best = successive_halving(args.game, candidates, args.games, args.ms, chars, args.processes, args.seed)
+    print(f'\nBest: {best}\n\t{best.spec(chars[0], args.ms)}')
+
+
+if __name__ == '__main__':
+    main()